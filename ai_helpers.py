@@ -12,10 +12,11 @@ ai_helpers.py - AI推論の共通化・ベストプラクティス
 import os
 import time
 import json
-from typing import Any, Dict, List, Optional, Callable
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Callable
 from dataclasses import dataclass
-import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 
 # ========================================
@@ -102,11 +103,13 @@ class AIClient:
                 "GOOGLE_API_KEY not found. Set environment variable or Streamlit secret."
             )
         
+        import google.generativeai as genai  # AI 利用時のみ必要なため遅延 import
         genai.configure(api_key=api_key)
         self._configured = True
     
-    def create_model(self, config: AIConfig = None) -> genai.GenerativeModel:
+    def create_model(self, config: AIConfig = None) -> "genai.GenerativeModel":
         """モデルインスタンスを作成"""
+        import google.generativeai as genai
         config = config or AIConfig()
         
         generation_config = {
@@ -144,6 +147,8 @@ class AIClient:
             AIResponseError: リトライ上限到達
             AITimeoutError: タイムアウト
         """
+        from google.api_core import exceptions as google_exceptions
+
         config = config or AIConfig()
         model = self.create_model(config)
         
@@ -450,6 +455,7 @@ def with_ai_retry(retries: int = 3, delay: float = 2.0):
     """
     def decorator(func):
         def wrapper(*args, **kwargs):
+            from google.api_core import exceptions as google_exceptions
             for attempt in range(retries):
                 try:
                     return func(*args, **kwargs)
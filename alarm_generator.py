@@ -4,8 +4,11 @@
 各シナリオに応じた適切なアラームを生成する
 """
 
-from typing import List, Dict, Any
+import re
+from functools import lru_cache, partial
+from typing import List, Dict, Any, Callable, Optional
 from logic import Alarm, simulate_cascade_failure
+from data import get_topology_index
 
 def generate_alarms_for_scenario(topology: Dict[str, Any], scenario: str) -> List[Alarm]:
     """
@@ -18,42 +21,43 @@ def generate_alarms_for_scenario(topology: Dict[str, Any], scenario: str) -> Lis
     Returns:
         生成されたアラームのリスト
     """
-    
-    # 正常稼働やLive診断の場合は空リスト
-    if "正常" in scenario or "---" in scenario or "[Live]" in scenario:
-        return []
+    handler = _resolve_scenario(scenario)
+    return handler(topology) if handler else []
+
+
+@lru_cache(maxsize=256)
+def _resolve_scenario(scenario: str) -> Optional[Callable[[Dict], List[Alarm]]]:
+    """
+    シナリオ名を1回だけ解析してアラーム生成関数に解決する（シナリオ名ごとにメモ化）
+    アラームを発生させないシナリオは None
+    """
+    # 正常稼働やLive診断の場合はアラームなし
+    if _QUIET_SCENARIO_RE.search(scenario):
+        return None
     
     # シナリオ別のアラーム生成ロジック
-    if "WAN全回線断" in scenario:
-        return _generate_wan_outage_alarms(topology)
-    
-    elif "FW片系障害" in scenario:
-        return _generate_fw_single_failure_alarms(topology)
-    
-    elif "L2SWサイレント障害" in scenario:
-        return _generate_l2sw_silent_failure_alarms(topology)
-    
-    elif "複合障害" in scenario:
-        return _generate_complex_failure_alarms(topology, scenario)
-    
-    elif "同時多発" in scenario:
-        return _generate_simultaneous_alarms(topology)
-    
-    # デバイス特定のシナリオ
-    else:
-        return _generate_device_specific_alarms(topology, scenario)
+    m = _SCENARIO_RE.search(scenario)
+    if m:
+        return partial(_SCENARIO_HANDLERS[m.group(0)], scenario=scenario)
+    
+    # 該当なしはデバイス特定のシナリオ（デバイス種別 × 障害タイプ）
+    device_m = _DEVICE_RE.search(scenario)
+    fault_m = _FAULT_RE.search(scenario)
+    if not device_m or not fault_m:
+        return None
+    return partial(
+        _generate_device_specific_alarms,
+        device=device_m.group(1),
+        fault_handler=_FAULT_HANDLERS[fault_m.group(0)],
+    )
 
 
 def _find_node_by_type(topology: Dict, node_type: str, layer: int = None) -> str:
     """ノードタイプでデバイスを検索"""
-    for node_id, node in topology.items():
-        if hasattr(node, 'type') and str(node.type) == node_type:
-            if layer is None or (hasattr(node, 'layer') and node.layer == layer):
-                return node_id
-    return None
+    return get_topology_index(topology).first(node_type, layer)
 
 
-def _generate_wan_outage_alarms(topology: Dict) -> List[Alarm]:
+def _generate_wan_outage_alarms(topology: Dict, scenario: str) -> List[Alarm]:
     """WAN全回線断のアラーム生成"""
     router_id = _find_node_by_type(topology, "ROUTER")
     if router_id:
@@ -61,7 +65,7 @@ def _generate_wan_outage_alarms(topology: Dict) -> List[Alarm]:
     return []
 
 
-def _generate_fw_single_failure_alarms(topology: Dict) -> List[Alarm]:
+def _generate_fw_single_failure_alarms(topology: Dict, scenario: str) -> List[Alarm]:
     """FW片系障害のアラーム生成（ハザーダス状態を明確に）"""
     fw_id = _find_node_by_type(topology, "FIREWALL")
     if fw_id:
@@ -73,17 +77,17 @@ def _generate_fw_single_failure_alarms(topology: Dict) -> List[Alarm]:
     return []
 
 
-def _generate_l2sw_silent_failure_alarms(topology: Dict) -> List[Alarm]:
+def _generate_l2sw_silent_failure_alarms(topology: Dict, scenario: str) -> List[Alarm]:
     """L2SWサイレント障害のアラーム生成"""
+    # L2スイッチを探す（複数の命名パターンに対応：L2_SW_01 > L2_SW_B01 > L2_SW の優先順）
     l2sw_id = None
-    
-    # L2スイッチを探す（複数の命名パターンに対応）
-    for pattern in ["L2_SW_01", "L2_SW_B01", "L2_SW"]:
-        for node_id in topology:
-            if pattern in node_id:
-                l2sw_id = node_id
-                break
-        if l2sw_id:
+    best_rank = len(_L2SW_RANK)
+    for node_id in topology:
+        for suffix in _L2SW_RE.findall(node_id):
+            rank = _L2SW_RANK[suffix]
+            if rank < best_rank:
+                l2sw_id, best_rank = node_id, rank
+        if best_rank == 0:
             break
     
     # それでもない場合はSWITCHでlayer=4を探す
@@ -91,19 +95,20 @@ def _generate_l2sw_silent_failure_alarms(topology: Dict) -> List[Alarm]:
         l2sw_id = _find_node_by_type(topology, "SWITCH", layer=4)
     
     if l2sw_id and l2sw_id in topology:
+        index = get_topology_index(topology)
+
         # 配下のAPやデバイスのアラームを生成
-        child_alarms = []
-        for node_id, node in topology.items():
-            if hasattr(node, 'parent_id') and node.parent_id == l2sw_id:
-                child_alarms.append(Alarm(node_id, "Connection Lost", "CRITICAL"))
+        child_alarms = [
+            Alarm(node_id, "Connection Lost", "CRITICAL")
+            for node_id in index.children_of.get(l2sw_id, [])
+        ]
         
-        # 配下が見つからない場合はAPを直接探す
+        # 配下が見つからない場合はAPを直接探す（最大4台まで）
         if not child_alarms:
-            for node_id, node in topology.items():
-                if hasattr(node, 'type') and "ACCESS_POINT" in str(node.type):
-                    child_alarms.append(Alarm(node_id, "Connection Lost", "CRITICAL"))
-                    if len(child_alarms) >= 4:  # 最大4台まで
-                        break
+            child_alarms = [
+                Alarm(node_id, "Connection Lost", "CRITICAL")
+                for node_id in index.by_type.get("ACCESS_POINT", [])[:4]
+            ]
         
         return child_alarms
     
@@ -122,7 +127,7 @@ def _generate_complex_failure_alarms(topology: Dict, scenario: str) -> List[Alar
     return []
 
 
-def _generate_simultaneous_alarms(topology: Dict) -> List[Alarm]:
+def _generate_simultaneous_alarms(topology: Dict, scenario: str) -> List[Alarm]:
     """同時多発障害のアラーム生成"""
     alarms = []
     
@@ -137,67 +142,105 @@ def _generate_simultaneous_alarms(topology: Dict) -> List[Alarm]:
     return alarms
 
 
-def _generate_device_specific_alarms(topology: Dict, scenario: str) -> List[Alarm]:
+def _generate_device_specific_alarms(topology: Dict, device: str, fault_handler: Callable) -> List[Alarm]:
     """デバイス固有のシナリオアラーム生成"""
     
     # ターゲットデバイスの特定
-    target_id = None
-    
-    if "[WAN]" in scenario:
-        target_id = _find_node_by_type(topology, "ROUTER")
-    elif "[FW]" in scenario:
-        target_id = _find_node_by_type(topology, "FIREWALL")
-    elif "[L2SW]" in scenario:
-        target_id = _find_node_by_type(topology, "SWITCH", layer=4)
-        if not target_id:
-            # L2_SW naming patternを試す
-            for node_id in topology:
-                if "L2_SW" in node_id:
-                    target_id = node_id
-                    break
+    node_type, layer = _DEVICE_TARGETS[device]
+    target_id = _find_node_by_type(topology, node_type, layer=layer)
+    if not target_id and device == "L2SW":
+        # L2_SW naming patternを試す
+        for node_id in topology:
+            if "L2_SW" in node_id:
+                target_id = node_id
+                break
     
     if not target_id:
         return []
     
     # 障害タイプ別のアラーム生成
-    alarms = []
-    
-    if "電源障害：片系" in scenario:
-        alarms = [
-            Alarm(target_id, "Power Supply 1 Failed", "WARNING"),
-            Alarm(target_id, "Redundancy Degraded", "WARNING")
-        ]
-        # FWの場合は追加のHA警告
-        if "[FW]" in scenario:
-            alarms.append(Alarm(target_id, "HA State: Degraded", "WARNING"))
-    
-    elif "電源障害：両系" in scenario:
-        if "[FW]" in scenario:
-            # FWは両系でも冗長があれば少し持ちこたえる可能性
-            alarms = [
-                Alarm(target_id, "Power Supply: Dual Loss", "CRITICAL"),
-                Alarm(target_id, "Device Critical", "CRITICAL")
-            ]
-        else:
-            # 他のデバイスはカスケード障害
-            return simulate_cascade_failure(target_id, topology, "Power Supply: Dual Loss (Device Down)")
-    
-    elif "FAN故障" in scenario:
-        alarms = [
-            Alarm(target_id, "Fan Module Failed", "WARNING"),
-            Alarm(target_id, "Temperature Rising", "WARNING")
-        ]
-    
-    elif "メモリリーク" in scenario:
-        alarms = [
-            Alarm(target_id, "Memory High (85% utilized)", "WARNING"),
-            Alarm(target_id, "Process: bgpd consuming excessive memory", "WARNING")
-        ]
-    
-    elif "BGP" in scenario:
-        alarms = [
-            Alarm(target_id, "BGP Neighbor Down/Up Flapping", "WARNING"),
-            Alarm(target_id, "Routing Table Unstable", "WARNING")
-        ]
-    
+    return fault_handler(topology, target_id, device)
+
+
+def _psu_single_alarms(topology: Dict, target_id: str, device: str) -> List[Alarm]:
+    """電源障害：片系"""
+    alarms = [
+        Alarm(target_id, "Power Supply 1 Failed", "WARNING"),
+        Alarm(target_id, "Redundancy Degraded", "WARNING")
+    ]
+    # FWの場合は追加のHA警告
+    if device == "FW":
+        alarms.append(Alarm(target_id, "HA State: Degraded", "WARNING"))
     return alarms
+
+
+def _psu_dual_alarms(topology: Dict, target_id: str, device: str) -> List[Alarm]:
+    """電源障害：両系"""
+    if device == "FW":
+        # FWは両系でも冗長があれば少し持ちこたえる可能性
+        return [
+            Alarm(target_id, "Power Supply: Dual Loss", "CRITICAL"),
+            Alarm(target_id, "Device Critical", "CRITICAL")
+        ]
+    # 他のデバイスはカスケード障害
+    return simulate_cascade_failure(target_id, topology, "Power Supply: Dual Loss (Device Down)")
+
+
+def _fan_failure_alarms(topology: Dict, target_id: str, device: str) -> List[Alarm]:
+    """FAN故障"""
+    return [
+        Alarm(target_id, "Fan Module Failed", "WARNING"),
+        Alarm(target_id, "Temperature Rising", "WARNING")
+    ]
+
+
+def _memory_leak_alarms(topology: Dict, target_id: str, device: str) -> List[Alarm]:
+    """メモリリーク"""
+    return [
+        Alarm(target_id, "Memory High (85% utilized)", "WARNING"),
+        Alarm(target_id, "Process: bgpd consuming excessive memory", "WARNING")
+    ]
+
+
+def _bgp_flapping_alarms(topology: Dict, target_id: str, device: str) -> List[Alarm]:
+    """BGPルートフラッピング"""
+    return [
+        Alarm(target_id, "BGP Neighbor Down/Up Flapping", "WARNING"),
+        Alarm(target_id, "Routing Table Unstable", "WARNING")
+    ]
+
+
+# =====================================================
+# ディスパッチテーブル（モジュール読み込み時に1回だけ構築）
+# =====================================================
+_QUIET_SCENARIO_RE = re.compile(r"正常|---|\[Live\]")
+
+# L2SW命名パターン（サフィックス → 優先順位）
+_L2SW_RE = re.compile(r"L2_SW(_B?01)?")
+_L2SW_RANK = {"_01": 0, "_B01": 1, "": 2}
+
+_SCENARIO_HANDLERS = {
+    "WAN全回線断": _generate_wan_outage_alarms,
+    "FW片系障害": _generate_fw_single_failure_alarms,
+    "L2SWサイレント障害": _generate_l2sw_silent_failure_alarms,
+    "複合障害": _generate_complex_failure_alarms,
+    "同時多発": _generate_simultaneous_alarms,
+}
+_SCENARIO_RE = re.compile("|".join(map(re.escape, _SCENARIO_HANDLERS)))
+
+# デバイスタグ → (ノードタイプ, レイヤー)
+_DEVICE_TARGETS = {
+    "WAN": ("ROUTER", None),
+    "FW": ("FIREWALL", None),
+    "L2SW": ("SWITCH", 4),
+}
+_DEVICE_RE = re.compile(r"\[(WAN|FW|L2SW)\]")
+
+_FAULT_HANDLERS = {
+    "電源障害：片系": _psu_single_alarms,
+    "電源障害：両系": _psu_dual_alarms,
+    "FAN故障": _fan_failure_alarms,
+    "メモリリーク": _memory_leak_alarms,
+    "BGP": _bgp_flapping_alarms,
+}
+_FAULT_RE = re.compile("|".join(map(re.escape, _FAULT_HANDLERS)))
@@ -1,12 +1,10 @@
 import streamlit as st
-import graphviz
 import os
 import time
-import google.generativeai as genai
 import json
 import re
 import pandas as pd
-from google.api_core import exceptions as google_exceptions
+import numpy as np
 try:
     import plotly.graph_objects as go
     import plotly.express as px
@@ -16,16 +14,26 @@ except ImportError:
     print("⚠️ Plotly not installed. Some visualizations will be limited.")
 from datetime import datetime, timedelta
 import math
+from collections import Counter
+from operator import itemgetter
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+    # ワーカースレッドからキャッシュ関数を呼ぶ際にスクリプト実行コンテキストを引き継ぐ
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
 
 # モジュール群のインポート
 from logic import CausalInferenceEngine, Alarm, simulate_cascade_failure
+from data import get_topology_index
 
 # Multi-tenant registry
 from registry import (
     list_tenants,
     list_networks,
     get_paths,
-    load_topology,
+    load_topology_cached,
     topology_mtime,
 )
 from network_ops import run_diagnostic_simulation, generate_remediation_commands, predict_initial_symptoms, generate_fake_log_by_ai
@@ -79,6 +87,16 @@ SCENARIO_IMPACT_MAP = {
     "正常稼働": 0,
 }
 
+# サイドバーのシナリオ一覧
+SCENARIO_MAP = {
+    "基本・広域障害": ["正常稼働", "1. WAN全回線断", "2. FW片系障害", "3. L2SWサイレント障害"],
+    "WAN Router": ["4. [WAN] 電源障害：片系", "5. [WAN] 電源障害：両系", "6. [WAN] BGPルートフラッピング", "7. [WAN] FAN故障", "8. [WAN] メモリリーク"],
+    "Firewall (Juniper)": ["9. [FW] 電源障害：片系", "10. [FW] 電源障害：両系", "11. [FW] FAN故障", "12. [FW] メモリリーク"],
+    "L2 Switch": ["13. [L2SW] 電源障害：片系", "14. [L2SW] 電源障害：両系", "15. [L2SW] FAN故障", "16. [L2SW] メモリリーク"],
+    "複合・その他": ["17. [WAN] 複合障害：電源＆FAN", "18. [Complex] 同時多発：FW & AP", "99. [Live] Cisco実機診断"]
+}
+ALL_SCENARIOS = [s for scenarios in SCENARIO_MAP.values() for s in scenarios]
+
 def _get_scenario_impact_level(selected_scenario: str) -> int:
     if selected_scenario in SCENARIO_IMPACT_MAP:
         return SCENARIO_IMPACT_MAP[selected_scenario]
@@ -95,62 +113,64 @@ def display_company(tenant_id: str) -> str:
         return tenant_id
     return f"{tenant_id}社"
 
-def _node_type(node) -> str:
-    try: return str(getattr(node, "type", "UNKNOWN"))
-    except Exception: return "UNKNOWN"
+def _find_target_node_id(topology: dict, node_type: str | None = None, layer: int | None = None, keyword: str | None = None) -> str | None:
+    # インデックス参照＋条件ごとのメモ化（トポロジー読み込み単位で共有）
+    return get_topology_index(topology).find(node_type, layer, keyword)
 
-def _node_layer(node) -> int:
-    try: return int(getattr(node, "layer", 999))
-    except Exception: return 999
+_QUIET_SCENARIO_RE = re.compile(r"---|正常|Live")
 
-def _find_target_node_id(topology: dict, node_type: str | None = None, layer: int | None = None, keyword: str | None = None) -> str | None:
-    for node_id, node in topology.items():
-        if node_type and _node_type(node) != node_type: continue
-        if layer is not None and _node_layer(node) != layer: continue
-        if keyword and keyword not in str(node_id): continue
-        return node_id
-    return None
+def _is_quiet_scenario(selected_scenario: str) -> bool:
+    """正常稼働・Live診断などアラームを発生させないシナリオか"""
+    return bool(_QUIET_SCENARIO_RE.search(selected_scenario))
 
 def _make_alarms(topology: dict, selected_scenario: str):
     if ALARM_GENERATOR_AVAILABLE:
         return generate_alarms_for_scenario(topology, selected_scenario)
     return _make_alarms_legacy(topology, selected_scenario)
 
+# レガシー生成用ディスパッチテーブル（いずれも先頭のエントリから優先）
+# (シナリオ中のトークン, (ノードタイプ, レイヤー))
+_LEGACY_DEVICE_TARGETS = (
+    ("WAN", ("ROUTER", None)),
+    ("FW", ("FIREWALL", None)),
+    ("L2SW", ("SWITCH", 4)),
+)
+# (シナリオに全て含まれるトークン, (メッセージ, 重要度))
+_LEGACY_FAULT_ALARMS = (
+    (("電源", "片系"), ("Power Supply 1 Failed", "WARNING")),
+    (("電源",), ("Power Supply: Dual Loss", "CRITICAL")),
+    (("FAN",), ("Fan Fail", "WARNING")),
+    (("メモリ",), ("Memory High", "WARNING")),
+    (("BGP",), ("BGP Flapping", "WARNING")),
+)
+
+def _resolve_legacy_plan(selected_scenario: str):
+    """シナリオ文字列から (FW片系障害か, 対象デバイス, 障害アラーム) を解決"""
+    fw_single = "FW片系障害" in selected_scenario
+    target = next((t for token, t in _LEGACY_DEVICE_TARGETS if token in selected_scenario), None)
+    fault = next((alarm for tokens, alarm in _LEGACY_FAULT_ALARMS
+                  if all(t in selected_scenario for t in tokens)), None)
+    return fw_single, target, fault
+
 def _make_alarms_legacy(topology: dict, selected_scenario: str):
-    if "---" in selected_scenario or "正常" in selected_scenario: return []
-    if "Live" in selected_scenario or "[Live]" in selected_scenario: return []
+    if _is_quiet_scenario(selected_scenario): return []
     
-    alarms = []
-    target_device_id = None
+    # 呼び出し時に該当シナリオ分のみ解決（結果は _scope_alarms でスコープ単位にキャッシュされる）
+    fw_single, target, fault = _resolve_legacy_plan(selected_scenario)
     
     # FW片系障害の処理
-    if "FW片系障害" in selected_scenario:
+    if fw_single:
         fid = _find_target_node_id(topology, node_type="FIREWALL")
         if fid:
             return [Alarm(fid, "Heartbeat Loss", "WARNING"), 
                     Alarm(fid, "HA State: Degraded", "WARNING")]
     
-    if "[WAN]" in selected_scenario or "WAN" in selected_scenario:
-        target_device_id = _find_target_node_id(topology, node_type="ROUTER")
-    elif "[FW]" in selected_scenario or "FW" in selected_scenario:
-        target_device_id = _find_target_node_id(topology, node_type="FIREWALL")
-    elif "[L2SW]" in selected_scenario or "L2SW" in selected_scenario:
-        target_device_id = _find_target_node_id(topology, node_type="SWITCH", layer=4)
+    if target is None: return []
+    node_type, layer = target
+    target_device_id = _find_target_node_id(topology, node_type=node_type, layer=layer)
+    if not target_device_id: return []
     
-    if target_device_id:
-        if "電源" in selected_scenario:
-            if "片系" in selected_scenario:
-                alarms.append(Alarm(target_device_id, "Power Supply 1 Failed", "WARNING"))
-            else:
-                alarms.append(Alarm(target_device_id, "Power Supply: Dual Loss", "CRITICAL"))
-        elif "FAN" in selected_scenario:
-            alarms.append(Alarm(target_device_id, "Fan Fail", "WARNING"))
-        elif "メモリ" in selected_scenario:
-            alarms.append(Alarm(target_device_id, "Memory High", "WARNING"))
-        elif "BGP" in selected_scenario:
-            alarms.append(Alarm(target_device_id, "BGP Flapping", "WARNING"))
-            
-    return alarms
+    return [Alarm(target_device_id, *fault)] if fault else []
 
 def _status_from_alarms(selected_scenario: str, alarms) -> str:
     """改良版：影響度ベースでステータスを決定"""
@@ -168,9 +188,8 @@ def _status_from_alarms(selected_scenario: str, alarms) -> str:
     
     # 中程度の冗長性喪失
     elif impact_level >= ImpactLevel.DEGRADED_MID:
-        severities = [str(getattr(a, "severity", "")).upper() for a in alarms]
-        # CRITICALアラームがある場合は「要対応」に格上げ
-        if any(s == "CRITICAL" for s in severities): 
+        # CRITICALアラームがある場合は「要対応」に格上げ（最初に見つかった時点で打ち切り）
+        if any(str(getattr(a, "severity", "")).upper() == "CRITICAL" for a in alarms): 
             return "要対応"
         return "注意"
     
@@ -181,73 +200,237 @@ def _status_from_alarms(selected_scenario: str, alarms) -> str:
     else: 
         return "正常"
 
-def _build_company_rows(selected_scenario: str):
-    maint_flags = st.session_state.get("maint_flags", {}) or {}
-    prev = st.session_state.get("prev_company_snapshot", {}) or {}
-    rows = []
-    
-    all_scopes = []
+def _summarize_alarms(selected_scenario: str, alarms) -> dict:
+    return {"alarm_count": len(alarms), "status": _status_from_alarms(selected_scenario, alarms)}
+
+def _load_scope_topology(tenant_id: str, network_id: str, mtime: float) -> dict:
     try:
-        for t in list_tenants():
-            for n in list_networks(t):
-                all_scopes.append((t, n))
+        return load_topology_cached(get_paths(tenant_id, network_id).topology_path, mtime)
     except:
-        all_scopes = [("A", "default"), ("B", "default")]
+        return {}
 
-    for tenant_id, network_id in all_scopes:
-        try:
-            paths = get_paths(tenant_id, network_id)
-            topo = load_topology(paths.topology_path)
-        except:
-            topo = {}
-
-        alarms = _make_alarms(topo, selected_scenario)
-        alarm_count = len(alarms)
-        status = _status_from_alarms(selected_scenario, alarms)
-        is_maint = bool(maint_flags.get(tenant_id, False))
-
-        key = f"{tenant_id}/{network_id}"
-        prev_count = prev.get(key, {}).get("alarm_count")
-        delta = None if prev_count is None else (alarm_count - prev_count)
-
-        # MTTR計算（モック）
-        if status in ["停止", "要対応"]:
-            mttr = f"{30 + alarm_count * 5}分"
-        else:
-            mttr = "-"
+# スコープ単位キャッシュの上限（トポロジー更新で古い mtime のエントリが残り続けないように）
+SCOPE_CACHE_ENTRIES = 512
+
+@st.cache_resource(show_spinner=False, max_entries=SCOPE_CACHE_ENTRIES)
+def _scope_alarms(tenant_id: str, network_id: str, mtime: float) -> dict:
+    """
+    全シナリオ分のアラームを1回で生成（全社ボードとコックピットで共有）
+    ※ cache_resource で参照共有（rerun ごとの pickle/unpickle を回避）するため、値は不変の tuple で保持
+    """
+    topo = _load_scope_topology(tenant_id, network_id, mtime)
+    return {
+        scenario: () if _is_quiet_scenario(scenario) else tuple(_make_alarms(topo, scenario))
+        for scenario in ALL_SCENARIOS
+    }
+
+def _alarms_for(tenant_id: str, network_id: str, selected_scenario: str, mtime: float) -> list:
+    if _is_quiet_scenario(selected_scenario):
+        # 正常稼働/Live はアラームなし: キャッシュ構築（トポロジー読み込み）を待たずに返す
+        return []
+    alarms = _scope_alarms(tenant_id, network_id, mtime).get(selected_scenario)
+    if alarms is None:
+        return _make_alarms(_load_scope_topology(tenant_id, network_id, mtime), selected_scenario)
+    return list(alarms)
+
+@st.cache_data(show_spinner=False, max_entries=SCOPE_CACHE_ENTRIES)
+def _summarize_scope(tenant_id: str, network_id: str, mtime: float) -> dict:
+    """全シナリオ分の集計を1回で作成（シナリオ切替時はキャッシュ参照のみ）"""
+    scope_alarms = _scope_alarms(tenant_id, network_id, mtime)
+    return {scenario: _summarize_alarms(scenario, alarms) for scenario, alarms in scope_alarms.items()}
+
+def _scope_summary(tenant_id: str, network_id: str, mtime: float, selected_scenario: str) -> dict:
+    summary = _summarize_scope(tenant_id, network_id, mtime).get(selected_scenario)
+    if summary is None:
+        summary = _summarize_alarms(selected_scenario, _alarms_for(tenant_id, network_id, selected_scenario, mtime))
+    return summary
+
+@st.cache_data(show_spinner=False, ttl=1.0)
+def _all_scopes(tenants: tuple) -> tuple:
+    """
+    ((tenant_id, network_id), ...) を返す
+    ※ 一覧自体は registry 側でディレクトリ mtime ごとにキャッシュ済み。連続 rerun ではテナント数ぶんの stat も省略
+    """
+    return tuple((t, n) for t in tenants for n in list_networks(t))
+
+@st.cache_data(show_spinner=False, ttl=1.0)
+def _scope_tasks(scopes: tuple) -> tuple:
+    """
+    ((tenant_id, network_id, topology mtime), ...) を返す
+    ※ ウィジェット操作の連続 rerun で stat を繰り返さないよう、1秒だけ結果を再利用
+    """
+    return tuple((t, n, topology_mtime(get_paths(t, n).topology_path)) for t, n in scopes)
 
-        rows.append({
+@st.cache_data(show_spinner=False, max_entries=64)
+def _board_summaries(selected_scenario: str, tasks: tuple) -> list:
+    """
+    全スコープ分の集計を1回のキャッシュ参照で返す（スコープ数ぶんのキャッシュ参照・ハッシュ計算を省略）
+    tasks: ((tenant_id, network_id, topology mtime), ...) ※ mtime が変わればキーも変わる
+    """
+    # スコープごとの集計は独立しているため、件数が多い場合はスレッドで並列化
+    if len(tasks) <= 2:
+        return [_scope_summary(t, n, m, selected_scenario) for t, n, m in tasks]
+    ctx = get_script_run_ctx() if get_script_run_ctx is not None else None
+
+    def _run(task):
+        # 共有プールのスレッドは使い回されるため、タスクごとに現在の実行コンテキストを付与
+        if add_script_run_ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return _scope_summary(*task, selected_scenario)
+
+    return list(_board_pool().map(_run, tasks))
+
+@st.cache_resource(show_spinner=False)
+def _board_pool() -> ThreadPoolExecutor:
+    """
+    全社ボード集計用のスレッドプール（プロセス内で共有し、集計ごとの生成・破棄を省略）
+    ※ コールドキャッシュ時はトポロジー読み込み（I/O）待ちが主なため、スレッド数は多めに確保
+    """
+    return ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4), thread_name_prefix="board")
+
+def _company_base_rows(all_scopes: list, summaries: list) -> list:
+    """集計結果から行の静的な部分（セッション状態に依存しない列）を構築"""
+    base_rows = []
+    for (tenant_id, network_id), summary in zip(all_scopes, summaries):
+        alarm_count = summary["alarm_count"]
+        status = summary["status"]
+        priority = _STATUS_PRIORITY[status]
+        base_rows.append({
             "tenant": tenant_id,
             "network": network_id,
             "company_network": f"{display_company(tenant_id)} / {network_id}",
+            "scope_key": f"{tenant_id}/{network_id}",
             "status": status,
+            "icon": _STATUS_ICONS[status],
             "alarm_count": alarm_count,
-            "delta": delta,
-            "maintenance": is_maint,
-            "mttr": mttr,
-            "priority": 1 if status == "停止" else (2 if status == "要対応" else 3),
+            "mttr": _mttr_label(status, alarm_count),
+            "priority": priority,
+            "triage_rank": (priority, -alarm_count),
+            "severity": _triage_severity(status, alarm_count),
         })
+    return base_rows
 
-    st.session_state.prev_company_snapshot = {
-        f'{r["tenant"]}/{r["network"]}': {"alarm_count": r["alarm_count"]} for r in rows
-    }
+def _build_company_rows(selected_scenario: str):
+    maint_flags = st.session_state.get("maint_flags", {}) or {}
+    # 前回描画時のアラーム件数 {"tenant/network": alarm_count}（変化したキーのみ上書き更新）
+    prev = st.session_state.setdefault("prev_alarm_counts", {})
+    # 初回描画では比較対象がないため差分計算を省略し、最後にまとめて記録する
+    first_render = not prev
+    
+    try:
+        all_scopes = list(_all_scopes(tuple(TENANTS)))
+    except (OSError, ValueError, KeyError):
+        # テナント/ネットワークの列挙に失敗した場合（ディレクトリ・不正な定義など）は既定スコープで表示
+        all_scopes = [("A", "default"), ("B", "default")]
+
+    if _is_quiet_scenario(selected_scenario):
+        # 正常稼働/Live は全スコープでアラームなし: トポロジー読み込み・集計を省略
+        inputs_key = (selected_scenario, tuple(all_scopes))
+    else:
+        inputs_key = (selected_scenario, _scope_tasks(tuple(all_scopes)))
+
+    # シナリオとスコープ（mtime 含む）が前回と同じなら行の静的部分を使い回す
+    # （テナント/ネットワーク選択などボードに無関係な操作で、集計参照・行構築を省略）
+    cached = st.session_state.get("board_rows_cache")
+    if cached is not None and cached[0] == inputs_key:
+        base_rows = cached[1]
+    else:
+        if _is_quiet_scenario(selected_scenario):
+            summaries = [{"alarm_count": 0, "status": "正常"} for _ in all_scopes]
+        else:
+            summaries = _board_summaries(selected_scenario, inputs_key[1])
+        base_rows = _company_base_rows(all_scopes, summaries)
+        st.session_state.board_rows_cache = (inputs_key, base_rows)
+
+    # 差分・メンテナンス状態のみセッションごとに重ねる
+    rows = []
+    for base in base_rows:
+        key = base["scope_key"]
+        alarm_count = base["alarm_count"]
+        if first_render:
+            delta = None
+        else:
+            prev_count = prev.get(key)
+            delta = None if prev_count is None else (alarm_count - prev_count)
+            if prev_count != alarm_count:
+                prev[key] = alarm_count
+        rows.append({**base, "delta": delta, "maintenance": bool(maint_flags.get(base["tenant"], False))})
+
+    if first_render:
+        prev.update((r["scope_key"], r["alarm_count"]) for r in rows)
+    # 削除されたスコープのキーを除去
+    elif len(prev) > len(rows):
+        live_keys = {r["scope_key"] for r in rows}
+        for stale in [k for k in prev if k not in live_keys]:
+            del prev[stale]
     return rows
 
 # =====================================================
 # 改良版プロフェッショナルダッシュボード
 # =====================================================
+_STATUS_ICONS = {"停止": "🔴", "要対応": "🟠", "注意": "🟡", "正常": "🟢"}
+# トリアージ優先度（小さいほど優先）: 行ごとの条件分岐を表引きに置き換え
+_STATUS_PRIORITY = {"停止": 1, "要対応": 2, "注意": 3, "正常": 3}
+
+# トリアージでカード表示する最大件数（超過分は表形式）
+TRIAGE_CARD_LIMIT = 10
+# 表形式で一度に表示する件数（「続きを表示」で追加）
+TRIAGE_TABLE_PAGE = 50
+# この行数以下の静的な表は st.dataframe ではなく Markdown 表で描画
+SMALL_TABLE_ROWS = 20
+
+# ステータス → (バー色, 文字色)
+_TRIAGE_BAR_COLORS = {
+    "停止": ('#d32f2f', '#ffffff'),    # 濃い赤
+    "要対応": ('#f57c00', '#ffffff'),  # オレンジ
+    "注意": ('#fbc02d', '#000000'),    # 黄色
+    "正常": ('#66bb6a', '#ffffff'),    # 緑
+}
+
+def _mttr_label(status: str, alarm_count: int) -> str:
+    """MTTR計算（モック）"""
+    if status in ("停止", "要対応"):
+        return f"{30 + alarm_count * 5}分"
+    return "-"
+
+def _triage_severity(status: str, alarm_count: int) -> int:
+    """アラーム数とステータスに基づく深刻度（%）"""
+    if status == "停止":
+        return 100
+    if status == "要対応":
+        # アラーム数に応じて70-95%の範囲で変動
+        return min(95, 70 + alarm_count * 2)
+    if status == "注意":
+        # アラーム数に応じて30-60%の範囲で変動
+        return min(60, 30 + alarm_count * 3)
+    return max(5, alarm_count * 2)  # 正常でも少し表示
+
+def _new_table_selection(event, state_key: str):
+    """
+    st.dataframe の行選択のうち、前回処理したものから変わった場合のみその行番号を返す
+    ※ 行選択は rerun 後も残るため、他の操作でスコープを切り替えた後に古い選択へ引き戻さないようにする
+    """
+    selected = event.selection.rows[0] if event and event.selection.rows else None
+    if selected == st.session_state.get(state_key):
+        return None
+    st.session_state[state_key] = selected
+    return selected
+
+@st.fragment
 def _render_all_companies_board(selected_scenario: str, df_height: int = 220):
     """
     完全改良版: ダイナミックビジュアルとプロフェッショナルUI
+    ※ フィルタ・ソート・追加表示などボード内の操作ではこの部分だけ再実行
+      （スコープ選択時のみ st.rerun() でアプリ全体を再実行し、下段コックピットを更新）
     """
     rows = _build_company_rows(selected_scenario)
     
     # 集計
-    df_rows = pd.DataFrame(rows)
-    count_stop = len(df_rows[df_rows['status'] == '停止'])
-    count_action = len(df_rows[df_rows['status'] == '要対応'])
-    count_warn = len(df_rows[df_rows['status'] == '注意'])
-    count_normal = len(df_rows[df_rows['status'] == '正常'])
+    status_counts = Counter(r['status'] for r in rows)
+    count_stop = status_counts['停止']
+    count_action = status_counts['要対応']
+    count_warn = status_counts['注意']
+    count_normal = status_counts['正常']
     
     # アラーム数の集計（エラー修正用）
     alarm_counts = [r['alarm_count'] for r in rows]
@@ -275,54 +458,53 @@ def _render_all_companies_board(selected_scenario: str, df_height: int = 220):
         
         if not PLOTLY_AVAILABLE:
             st.warning("⚠️ Plotlyがインストールされていません。フルバージョンを表示するには: `pip install plotly`")
-            # 簡易版表示
-            cols_per_row = 4
-            for i in range(0, len(rows), cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j, col in enumerate(cols):
-                    if i + j < len(rows):
-                        r = rows[i + j]
-                        with col:
-                            color = {"停止": "🔴", "要対応": "🟠", "注意": "🟡", "正常": "🟢"}[r['status']]
-                            if st.button(
-                                f"{color} {r['company_network']}\n{r['alarm_count']}件",
-                                key=f"heat_{r['tenant']}_{r['network']}",
-                                use_container_width=True
-                            ):
-                                st.session_state.selected_scope = {"tenant": r['tenant'], "network": r['network']}
-                                st.rerun()
+            # 簡易版表示（会社ごとのボタンではなく1つの表にまとめ、行選択で詳細へ遷移）
+            event = st.dataframe(
+                pd.DataFrame({
+                    "状態": [r['icon'] for r in rows],
+                    "会社 / ネットワーク": [r['company_network'] for r in rows],
+                    "アラーム数": alarm_counts,
+                }),
+                use_container_width=True,
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                key="heat_table",
+            )
+            # ユーザーが選択を変えた時のみ遷移（他の操作でスコープを切り替えた後に引き戻さない）
+            selected = _new_table_selection(event, "heat_table_handled")
+            if selected is not None and selected < len(rows):
+                r = rows[selected]
+                scope = {"tenant": r['tenant'], "network": r['network']}
+                if st.session_state.get("selected_scope") != scope:
+                    st.session_state.selected_scope = scope
+                    st.rerun()
         else:
             # Plotlyバブルチャート（改良版）
-            data_for_plot = []
             
             # 全体の健全性スコアを計算
-            total_critical = sum(1 for r in rows if r['status'] == '停止')
-            total_warning = sum(1 for r in rows if r['status'] == '要対応')
-            overall_health = 100 - (total_critical * 30 + total_warning * 15)  # 健全性スコア
+            overall_health = 100 - (count_stop * 30 + count_action * 15)  # 健全性スコア
             
-            for r in rows:
-                # ステータスに基づく色の値（健全性を反映）
-                if r['status'] == "停止":
-                    color_value = 100
-                elif r['status'] == "要対応":
-                    color_value = 70 + (r['alarm_count'] / max(max_alarms, 1)) * 10
-                elif r['status'] == "注意":
-                    color_value = 30 + (r['alarm_count'] / max(max_alarms, 1)) * 20
-                else:
-                    color_value = 5
-                
-                data_for_plot.append({
-                    "会社": r['company_network'],
-                    "アラーム数": r['alarm_count'],
-                    "ステータス": r['status'],
-                    "色値": color_value,
-                    "tenant": r['tenant'],
-                    "network": r['network'],
-                    "表示テキスト": f"{r['company_network']}<br>{r['alarm_count']}件",
-                    "メンテナンス": "🛠️" if r['maintenance'] else ""
-                })
+            # 列指向の dict から一括構築（行ごとの dict 生成と列型推論を省略）
+            df_plot = pd.DataFrame({
+                "会社": [r['company_network'] for r in rows],
+                "アラーム数": alarm_counts,
+                "ステータス": [r['status'] for r in rows],
+                "tenant": [r['tenant'] for r in rows],
+                "network": [r['network'] for r in rows],
+                "表示テキスト": [f"{r['company_network']}<br>{r['alarm_count']}件" for r in rows],
+                "メンテナンス": ["🛠️" if r['maintenance'] else "" for r in rows],
+            })
+            counts = df_plot['アラーム数'].to_numpy()
+            statuses = df_plot['ステータス'].to_numpy()
             
-            df_plot = pd.DataFrame(data_for_plot)
+            # ステータスに基づく色の値（健全性を反映）: 行ループではなく列単位で一括計算
+            alarm_ratio = counts / max(max_alarms, 1)
+            df_plot['色値'] = np.select(
+                [statuses == "停止", statuses == "要対応", statuses == "注意"],
+                [100, 70 + alarm_ratio * 10, 30 + alarm_ratio * 20],
+                default=5,
+            )
             
             # 全体健全性インジケーター
             health_color = '#4caf50' if overall_health > 80 else '#ffc107' if overall_health > 50 else '#f44336'
@@ -374,43 +556,31 @@ def _render_all_companies_board(selected_scenario: str, df_height: int = 220):
                 
                 # X, Y座標の生成（密集配置、間隔を動的に調整）
                 spacing = 1.0 if n_companies <= 10 else 0.8  # 会社が多い場合は間隔を狭める
-                x_coords = []
-                y_coords = []
-                for i in range(n_companies):
-                    # ジグザグ配置で視認性向上
-                    row = i // cols
-                    col = i % cols
-                    # 偶数行は少しずらす
-                    x_offset = 0.2 if row % 2 == 1 else 0
-                    x = col * spacing + x_offset
-                    y = row * spacing
-                    x_coords.append(x)
-                    y_coords.append(y)
-                
-                df_plot['x'] = x_coords
-                df_plot['y'] = y_coords
+                # ジグザグ配置で視認性向上（奇数行は少しずらす）
+                grid_row, grid_col = np.divmod(np.arange(n_companies), cols)
+                df_plot['x'] = grid_col * spacing + np.where(grid_row % 2 == 1, 0.2, 0)
+                df_plot['y'] = grid_row * spacing
                 
                 # バブルサイズの計算（より明確な差をつける）
                 # アラーム数に応じて3段階のサイズ設定
-                sizes = []
-                for alarm_count in df_plot['アラーム数']:
-                    if alarm_count == 0:
-                        size = 25  # 最小サイズ
-                    elif alarm_count <= 5:
-                        size = 35 + alarm_count * 5  # 小〜中サイズ
-                    elif alarm_count <= 15:
-                        size = 60 + (alarm_count - 5) * 3  # 中〜大サイズ
-                    else:
-                        size = min(100, 90 + (alarm_count - 15) * 1)  # 最大サイズ（上限設定）
-                    sizes.append(size)
-                df_plot['size'] = sizes
+                df_plot['size'] = np.select(
+                    [counts == 0, counts <= 5, counts <= 15],
+                    [
+                        25,                          # 最小サイズ
+                        35 + counts * 5,             # 小〜中サイズ
+                        60 + (counts - 5) * 3,       # 中〜大サイズ
+                    ],
+                    default=np.minimum(100, 90 + (counts - 15)),  # 最大サイズ（上限設定）
+                )
                 
                 fig = go.Figure()
                 
                 # 各ステータスごとにトレースを追加（凡例のため）
+                # ステータス別の分割は groupby で1回だけ行う（ステータスごとのマスク走査を省略）
+                status_groups = dict(tuple(df_plot.groupby('ステータス', sort=False)))
                 for status in ["停止", "要対応", "注意", "正常"]:
-                    df_status = df_plot[df_plot['ステータス'] == status]
-                    if len(df_status) > 0:
+                    df_status = status_groups.get(status)
+                    if df_status is not None and len(df_status) > 0:
                         fig.add_trace(go.Scatter(
                             x=df_status['x'],
                             y=df_status['y'],
@@ -547,21 +717,24 @@ def _render_all_companies_board(selected_scenario: str, df_height: int = 220):
         
         # ソート
         if sort_by == "優先度順":
-            filtered_rows.sort(key=lambda x: (x['priority'], -x['alarm_count']))
+            filtered_rows.sort(key=itemgetter('triage_rank'))
         elif sort_by == "アラーム数順":
-            filtered_rows.sort(key=lambda x: -x['alarm_count'])
+            # reverse=True でも同数の行は元の順序を保つ（安定ソート）
+            filtered_rows.sort(key=itemgetter('alarm_count'), reverse=True)
         else:
-            filtered_rows.sort(key=lambda x: x['company_network'])
+            filtered_rows.sort(key=itemgetter('company_network'))
         
         if filtered_rows:
-            # 改良版トリアージリスト
-            for idx, r in enumerate(filtered_rows):
+            # 改良版トリアージリスト（上位のみカード表示、残りは1つの表にまとめてウィジェット数を抑える）
+            card_rows = filtered_rows[:TRIAGE_CARD_LIMIT]
+            rest_rows = filtered_rows[TRIAGE_CARD_LIMIT:]
+            for idx, r in enumerate(card_rows):
                 with st.container():
                     cols = st.columns([0.5, 3, 1.5, 1.5, 1, 1])
                     
                     # ステータスアイコン
                     with cols[0]:
-                        icon = {"停止": "🔴", "要対応": "🟠", "注意": "🟡", "正常": "🟢"}[r['status']]
+                        icon = r['icon']
                         st.markdown(f"### {icon}")
                     
                     # 会社情報
@@ -573,24 +746,8 @@ def _render_all_companies_board(selected_scenario: str, df_height: int = 220):
                     # 深刻度（改良版：コンパクトで動的なプログレスバー）
                     with cols[2]:
                         # アラーム数とステータスに基づく深刻度計算
-                        if r['status'] == "停止":
-                            severity = 100
-                            bar_color = '#d32f2f'  # 濃い赤
-                            text_color = '#ffffff'
-                        elif r['status'] == "要対応":
-                            # アラーム数に応じて70-95%の範囲で変動
-                            severity = min(95, 70 + r['alarm_count'] * 2)
-                            bar_color = '#f57c00'  # オレンジ
-                            text_color = '#ffffff'
-                        elif r['status'] == "注意":
-                            # アラーム数に応じて30-60%の範囲で変動
-                            severity = min(60, 30 + r['alarm_count'] * 3)
-                            bar_color = '#fbc02d'  # 黄色
-                            text_color = '#000000'
-                        else:
-                            severity = max(5, r['alarm_count'] * 2)  # 正常でも少し表示
-                            bar_color = '#66bb6a'  # 緑
-                            text_color = '#ffffff'
+                        severity = r['severity']
+                        bar_color, text_color = _TRIAGE_BAR_COLORS.get(r['status'], _TRIAGE_BAR_COLORS["正常"])
                         
                         # コンパクトなプログレスバー（高さを抑える）
                         st.markdown(f"""
@@ -666,6 +823,46 @@ def _render_all_companies_board(selected_scenario: str, df_height: int = 220):
                                 st.rerun()
                     
                     st.divider()
+
+            if rest_rows:
+                st.caption(f"他 {len(rest_rows)} 件（行を選択すると詳細を表示）")
+                # ブラウザへ送る行数を抑える（先頭のみ表示し、必要に応じて追加表示）
+                # 追加表示の件数は表示条件ごとに保持（シナリオ・フィルタ・ソートが変われば先頭ページに戻す）
+                table_view = (selected_scenario, tuple(filter_status), tuple(filter_alarm), show_maint, sort_by)
+                cap_view, table_cap = st.session_state.get("triage_table_cap", (None, TRIAGE_TABLE_PAGE))
+                if cap_view != table_view:
+                    table_cap = TRIAGE_TABLE_PAGE
+                visible_rows = rest_rows[:table_cap]
+                df_rest = pd.DataFrame({
+                    "状態": [r['icon'] for r in visible_rows],
+                    "会社 / ネットワーク": [r['company_network'] + (" 🛠️" if r['maintenance'] else "") for r in visible_rows],
+                    "深刻度": [r['severity'] for r in visible_rows],
+                    "アラーム数": [r['alarm_count'] for r in visible_rows],
+                    "推定MTTR": [r['mttr'] for r in visible_rows],
+                })
+                event = st.dataframe(
+                    df_rest,
+                    use_container_width=True,
+                    hide_index=True,
+                    on_select="rerun",
+                    selection_mode="single-row",
+                    key="triage_rest",
+                    column_config={
+                        "深刻度": st.column_config.ProgressColumn("深刻度", min_value=0, max_value=100, format="%d%%"),
+                    },
+                )
+                if len(rest_rows) > table_cap:
+                    if st.button(f"続きを表示（残り {len(rest_rows) - table_cap} 件）", key="triage_table_more"):
+                        st.session_state.triage_table_cap = (table_view, table_cap + TRIAGE_TABLE_PAGE)
+                        st.rerun(scope="fragment")
+                # ユーザーが選択を変えた時のみ遷移（フィルタ・ソート変更や他の操作では遷移しない）
+                selected = _new_table_selection(event, "triage_rest_handled")
+                if selected is not None and selected < len(visible_rows):
+                    r = visible_rows[selected]
+                    scope = {"tenant": r['tenant'], "network": r['network']}
+                    if st.session_state.get("selected_scope") != scope:
+                        st.session_state.selected_scope = scope
+                        st.rerun()
         else:
             st.info("フィルタ条件に該当するシステムはありません。")
     
@@ -773,44 +970,127 @@ def _get_impact_label(cand: dict, scope_status: str) -> str:
 def find_target_node_id(topology, node_type=None, layer=None, keyword=None):
     return _find_target_node_id(topology, node_type, layer, keyword)
 
+@st.cache_data(show_spinner=False, max_entries=256)
+def _read_config_file(path: str, mtime_ns: int) -> str:
+    """(パス, 更新時刻) ごとにファイル内容をメモ化（ファイルを編集すれば再読み込み）"""
+    with open(path, "r", encoding="utf-8") as f: return f.read()
+
+CONFIG_NOT_FOUND = "Config file not found."
+
+def _config_candidate_paths(device_id) -> list:
+    return [f"configs/{device_id}.txt", f"{device_id}.txt"]
+
 def load_config_by_id(device_id):
-    possible_paths = [f"configs/{device_id}.txt", f"{device_id}.txt"]
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, "r", encoding="utf-8") as f: return f.read()
-            except: pass
-    return "Config file not found."
+    for path in _config_candidate_paths(device_id):
+        try:
+            # 存在確認を兼ねて stat 1回のみ（内容はキャッシュから返す）
+            return _read_config_file(path, os.stat(path).st_mtime_ns)
+        except (OSError, ValueError): pass
+    return CONFIG_NOT_FOUND
+
+# コンフィグのサニタイズ/要約用パターン（呼び出しごとの再コンパイル・キャッシュ参照を省略）
+_ENCRYPTED_PASSWORD_RE = re.compile(r"(encrypted-password\s+)([\"']?)[^\"';\n]+([\"']?)", re.IGNORECASE)
+_IPV4_HOST_RE = re.compile(r"\b(\d{1,3}\.\d{1,3}\.\d{1,3})\.(\d{1,3})(/\d{1,2})?\b")
+_CONFIG_VERSION_RE = re.compile(r"\bversion\s+([^;\n]+)")
+_CONFIG_HOST_NAME_RE = re.compile(r"\bhost-name\s+([^;\s\n]+)")
+_CONFIG_INTERFACE_RE = re.compile(r"\b(ge-\d+/\d+/\d+)\b")
+_CONFIG_ADDRESS_START_RE = re.compile(r"\baddress\s")
+_CONFIG_ADDRESS_RE = re.compile(r"address\s+([^;\s\n]+)")
+# インターフェース名の直後からアドレス定義を探す範囲（文字数）
+_CONFIG_ADDRESS_WINDOW = 220
+_CONFIG_SECURITY_ZONE_RE = re.compile(r"security-zone\s+([^\s\{\n]+)")
+
+def _scan_interface_addresses(text: str) -> list:
+    """
+    インターフェース名ごとに、直後の一定範囲内で最初のアドレス定義を対応付ける
+    ※ 範囲付き最短一致の正規表現を、名前の検出と範囲内の先読みの2段に分けて線形時間で走査
+    """
+    interfaces = []
+    pos = 0
+    while True:
+        im = _CONFIG_INTERFACE_RE.search(text, pos)
+        if not im: break
+        pos = im.end()
+        # "address" + 空白1文字が収まる位置までを探索範囲とする
+        window_end = pos + _CONFIG_ADDRESS_WINDOW + len("address ")
+        for sm in _CONFIG_ADDRESS_START_RE.finditer(text, pos, window_end):
+            am = _CONFIG_ADDRESS_RE.match(text, sm.start())
+            if am:
+                interfaces.append({"name": im.group(1), "address": am.group(1)})
+                pos = am.end()
+                break
+    return interfaces
 
 def sanitize_config_text(raw_text: str) -> str:
     if not raw_text: return raw_text
     text = raw_text
-    text = re.sub(r"(encrypted-password\s+)([\"']?)[^\"';\n]+([\"']?)", r"\1\2***REDACTED***\3", text, flags=re.IGNORECASE)
-    text = re.sub(r"\b(\d{1,3}\.\d{1,3}\.\d{1,3})\.(\d{1,3})(/\d{1,2})?\b", r"\1.xxx\3", text)
+    text = _ENCRYPTED_PASSWORD_RE.sub(r"\1\2***REDACTED***\3", text)
+    text = _IPV4_HOST_RE.sub(r"\1.xxx\3", text)
     return text
 
 def build_config_summary(sanitized_text: str) -> dict:
     summary = {"os_version": None, "host_name": None, "interfaces": [], "zones": []}
     if not sanitized_text: return summary
-    m = re.search(r"\bversion\s+([^;\n]+)", sanitized_text)
+    m = _CONFIG_VERSION_RE.search(sanitized_text)
     if m: summary["os_version"] = m.group(1).strip()
-    m = re.search(r"\bhost-name\s+([^;\s\n]+)", sanitized_text)
+    m = _CONFIG_HOST_NAME_RE.search(sanitized_text)
     if m: summary["host_name"] = m.group(1).strip()
-    for im in re.finditer(r"\b(ge-\d+/\d+/\d+)\b[\s\S]{0,220}?\baddress\s+([^;\s\n]+)", sanitized_text):
-        summary["interfaces"].append({"name": im.group(1), "address": im.group(2)})
-    for zm in re.finditer(r"security-zone\s+([^\s\{\n]+)", sanitized_text):
+    summary["interfaces"] = _scan_interface_addresses(sanitized_text)
+    for zm in _CONFIG_SECURITY_ZONE_RE.finditer(sanitized_text):
         z = zm.group(1).strip()
         if z not in summary["zones"]: summary["zones"].append(z)
     return summary
 
-def load_config_sanitized(device_id: str) -> dict:
-    raw = load_config_by_id(device_id)
+@st.cache_data(show_spinner=False, max_entries=256)
+def _sanitized_config(path: str, mtime_ns: int) -> dict:
+    """
+    (パス, 更新時刻) ごとにサニタイズ・要約結果をメモ化（path="" はファイルなし）
+    ※ 同じ機器の再表示では正規表現による置換・要約抽出を再実行しない
+    """
+    raw = _read_config_file(path, mtime_ns) if path else CONFIG_NOT_FOUND
     sanitized = sanitize_config_text(raw)
     summary = build_config_summary(sanitized)
     excerpt = sanitized[:1500] if isinstance(sanitized, str) else ""
-    return {"device_id": device_id, "summary": summary, "excerpt": excerpt, "available": (raw != "Config file not found.")}
+    return {"summary": summary, "excerpt": excerpt, "available": (raw != CONFIG_NOT_FOUND)}
+
+def load_config_sanitized(device_id: str) -> dict:
+    for path in _config_candidate_paths(device_id):
+        try:
+            return {"device_id": device_id, **_sanitized_config(path, os.stat(path).st_mtime_ns)}
+        except (OSError, ValueError): pass
+    return {"device_id": device_id, **_sanitized_config("", 0)}
+
+@st.cache_resource(show_spinner=False, max_entries=SCOPE_CACHE_ENTRIES)
+def _get_logic_engine(tenant_id: str, network_id: str, mtime: float, _topology: dict) -> LogicalRCA:
+    """(tenant, network, topology mtime) ごとに LogicalRCA を1つだけ構築し、全セッションで共有"""
+    return LogicalRCA(_topology, config_dir=str(get_paths(tenant_id, network_id).config_dir))
+
+@st.cache_data(show_spinner=False, max_entries=SCOPE_CACHE_ENTRIES * len(ALL_SCENARIOS))
+def _analyze_scope_rules(tenant_id: str, network_id: str, selected_scenario: str, mtime: float) -> list:
+    """
+    スコープ×シナリオの RCA のうちルールで確定する部分のみメモ化
+    ※ LLM 判定（失敗時の AI_ERROR を含む）は呼び出しごとに変わり得るため、未確定のままキャッシュする
+    """
+    alarms = _alarms_for(tenant_id, network_id, selected_scenario, mtime)
+    engine = _get_logic_engine(tenant_id, network_id, mtime, _load_scope_topology(tenant_id, network_id, mtime))
+    return engine.analyze_rules(alarms, silent_ratio=0.3 if "サイレント" in selected_scenario else 0.5)
+
+def _analyze_scope(tenant_id: str, network_id: str, selected_scenario: str, mtime: float) -> list:
+    """スコープ×シナリオの RCA 結果（ルール判定はキャッシュから、LLM 判定のみ毎回実行）"""
+    if not _alarms_for(tenant_id, network_id, selected_scenario, mtime):
+        # アラームなし（正常稼働/Live）: エンジンの構築・推論は結果に影響しないため省略
+        return LogicalRCA.no_alarm_result()
+    partial = _analyze_scope_rules(tenant_id, network_id, selected_scenario, mtime)
+    engine = _get_logic_engine(tenant_id, network_id, mtime, _load_scope_topology(tenant_id, network_id, mtime))
+    return engine.complete_analysis(partial)
+
+def _genai():
+    """google.generativeai は AI 機能の利用時に初めて import（起動時の読み込みを省略）"""
+    import google.generativeai as genai
+    return genai
 
 def generate_content_with_retry(model, prompt, stream=True, retries=3):
+    from google.api_core import exceptions as google_exceptions
     for i in range(retries):
         try:
             return model.generate_content(prompt, stream=stream)
@@ -819,76 +1099,219 @@ def generate_content_with_retry(model, prompt, stream=True, retries=3):
             time.sleep(2 * (i + 1))
     return None
 
-def render_topology(alarms, root_cause_candidates):
-    graph = graphviz.Digraph()
-    graph.attr(rankdir='TB')
-    graph.attr('node', shape='box', style='rounded,filled', fontname='Helvetica')
+def _stream_text(response):
+    """
+    ストリーミング応答のテキスト断片を順に返す（st.write_stream 用）
+    ※ 安全フィルタ等でテキストを持たないチャンクが来た場合は注記を出して打ち切る
+    """
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            yield "\n\n⚠️ 応答が途中で打ち切られました。"
+            return
+        if text:
+            yield text
+
+def _dot_quote(text: str) -> str:
+    """DOT の文字列リテラルへ変換（ダブルクォート・バックスラッシュ・改行をエスケープ）"""
+    return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _topology_dot(tenant_id: str, network_id: str, mtime: float, alarmed_ids: tuple, node_status: tuple) -> str:
+    """
+    トポロジー図の DOT ソースを生成（アラーム・被疑箇所の組み合わせごとにメモ化）
+    ※ graphviz.Digraph を介さず DOT の行を直接組み立てる（ノード/エッジごとの属性整形を省略）
+    """
+    topology = _load_scope_topology(tenant_id, network_id, mtime)
+    lines = [
+        'digraph {',
+        '\trankdir=TB',
+        '\tnode [fontname=Helvetica shape=box style="rounded,filled"]',
+    ]
     
-    alarm_map = {a.device_id: a for a in alarms}
-    alarmed_ids = set(alarm_map.keys())
-    node_status_map = {c['id']: c['type'] for c in root_cause_candidates}
+    alarmed_ids = set(alarmed_ids)
+    node_status_map = dict(node_status)
+    # 冗長グループのメンバーはインデックスから参照（ノードごとの全件走査を回避）
+    redundancy_members = get_topology_index(topology).by_redundancy_group
+    # 親ごとの冗長パートナー（同じ親を持つ子の間で使い回す）
+    partners_of = {}
+    # ノード定義とエッジを1回の走査で生成（エッジはノード定義の後ろにまとめて出力）
+    edge_lines = []
+    emitted = set()
     
-    for node_id, node in TOPOLOGY.items():
+    for node_id, node in topology.items():
+        quoted_id = _dot_quote(node_id)
         color = "#e8f5e9"
         penwidth = "1"
         fontcolor = "black"
-        label = f"{node_id}\n({node.type})"
+        # ラベルは行のリストに集めて最後に1回だけ結合
+        label_parts = [node_id, f"({node.type})"]
         
         red_type = node.metadata.get("redundancy_type")
-        if red_type: label += f"\n[{red_type} Redundancy]"
+        if red_type: label_parts.append(f"[{red_type} Redundancy]")
         vendor = node.metadata.get("vendor")
-        if vendor: label += f"\n[{vendor}]"
+        if vendor: label_parts.append(f"[{vendor}]")
 
         status_type = node_status_map.get(node_id, "Normal")
         
         if "Silent" in status_type:
-            color = "#fff3e0"; penwidth = "4"; label += "\n[サイレント疑い]"
+            color = "#fff3e0"; penwidth = "4"; label_parts.append("[サイレント疑い]")
         elif "Hardware/Physical" in status_type or "Critical" in status_type:
-            color = "#ffcdd2"; penwidth = "3"; label += "\n[ROOT CAUSE]"
+            color = "#ffcdd2"; penwidth = "3"; label_parts.append("[ROOT CAUSE]")
         elif "Network/Unreachable" in status_type or "Network/Secondary" in status_type:
-            color = "#cfd8dc"; fontcolor = "#546e7a"; label += "\n[Unreachable]"
+            color = "#cfd8dc"; fontcolor = "#546e7a"; label_parts.append("[Unreachable]")
         elif node_id in alarmed_ids:
             color = "#fff9c4" 
         
-        graph.node(node_id, label=label, fillcolor=color, color='black', penwidth=penwidth, fontcolor=fontcolor)
-    
-    for node_id, node in TOPOLOGY.items():
-        if node.parent_id:
-            graph.edge(node.parent_id, node_id)
-            parent_node = TOPOLOGY.get(node.parent_id)
+        label = "\n".join(label_parts)
+        lines.append(
+            f'\t{quoted_id} [label={_dot_quote(label)} color=black '
+            f'fillcolor="{color}" fontcolor="{fontcolor}" penwidth={penwidth}]'
+        )
+
+        parent_id = node.parent_id
+        if not parent_id:
+            continue
+        partners = partners_of.get(parent_id)
+        if partners is None:
+            parent_node = topology.get(parent_id)
             if parent_node and parent_node.redundancy_group:
-                partners = [n.id for n in TOPOLOGY.values() 
-                           if n.redundancy_group == parent_node.redundancy_group and n.id != parent_node.id]
-                for partner_id in partners:
-                    graph.edge(partner_id, node_id)
-    return graph
+                partners = [pid for pid in redundancy_members.get(parent_node.redundancy_group, [])
+                            if pid != parent_id]
+            else:
+                partners = []
+            partners_of[parent_id] = partners
+        # 同一エッジは1回だけ出力
+        for src in (parent_id, *partners):
+            if (src, node_id) not in emitted:
+                emitted.add((src, node_id))
+                edge_lines.append(f'\t{_dot_quote(src)} -> {quoted_id}')
+    lines.extend(edge_lines)
+    lines.append('}')
+    return "\n".join(lines)
+
+# _topology_dot で強調表示の対象になる候補種別のキーワード
+_TOPOLOGY_STYLED_STATUSES = ("Silent", "Hardware/Physical", "Critical", "Network/Unreachable", "Network/Secondary")
+
+def render_topology(alarms, root_cause_candidates):
+    """現在のスコープのトポロジー図（DOT ソース）。rerun で入力が同じならキャッシュを返す"""
+    alarmed_ids = tuple(sorted({a.device_id for a in alarms}))
+    # 描画に影響しない種別（通常表示になるもの）はキーから除外し、キャッシュヒット率を上げる
+    node_status = tuple((c['id'], c['type']) for c in root_cause_candidates
+                        if any(k in c['type'] for k in _TOPOLOGY_STYLED_STATUSES))
+    # 行選択などグラフに影響しない rerun では、前回の DOT をそのまま返す（キャッシュのハッシュ計算・復元も省略）
+    render_key = (ACTIVE_TENANT, ACTIVE_NETWORK, topo_mtime, alarmed_ids, node_status)
+    cached = st.session_state.get("topology_dot_cache")
+    if cached is not None and cached[0] == render_key:
+        return cached[1]
+    dot = _topology_dot(*render_key)
+    st.session_state.topology_dot_cache = (render_key, dot)
+    return dot
+
+@st.fragment
+def _remediation_panel(selected_incident_candidate, selected_scenario, api_key, topology):
+    """修復プラン欄（ボタン操作ではこの部分だけ再実行し、全体の rerun を避ける）"""
+    # 自動修復フラグチェック
+    if st.session_state.get("auto_remediate"):
+        st.session_state.auto_remediate = False
+        if selected_incident_candidate and selected_incident_candidate["prob"] > 0.6:
+            st.session_state.remediation_plan = "Auto-generating..."
+    
+    if selected_incident_candidate and selected_incident_candidate["prob"] > 0.6:
+        if "remediation_plan" not in st.session_state:
+            if st.button("✨ 修復プランを作成 (Generate Fix)"):
+                 if not api_key: st.error("API Key Required")
+                 else:
+                    with st.spinner("Generating plan..."):
+                        t_node = topology.get(selected_incident_candidate["id"])
+                        plan_md = generate_remediation_commands(selected_scenario, f"Root Cause: {selected_incident_candidate['label']}", t_node, api_key)
+                        st.session_state.remediation_plan = plan_md
+                        st.rerun()
+        
+        if "remediation_plan" in st.session_state:
+            if st.session_state.remediation_plan == "Auto-generating...":
+                with st.spinner("自動修復プランを生成中..."):
+                    t_node = topology.get(selected_incident_candidate["id"])
+                    plan_md = generate_remediation_commands(selected_scenario, f"Root Cause: {selected_incident_candidate['label']}", t_node, api_key)
+                    st.session_state.remediation_plan = plan_md
+                    st.rerun()
+            else:
+                with st.container(border=True):
+                    st.info("AI Generated Recovery Procedure")
+                    st.markdown(st.session_state.remediation_plan)
+                c1, c2 = st.columns(2)
+                with c1:
+                    if st.button("🚀 修復実行 (Execute)", type="primary"):
+                        st.success("Remediation Executed.")
+                with c2:
+                    if st.button("キャンセル"):
+                        del st.session_state.remediation_plan; st.rerun()
+
+# チャット欄で常時描画する直近メッセージ数
+CHAT_WINDOW = 30
+
+@st.fragment
+def _chat_panel(selected_scenario, api_key):
+    """チャット欄（入力ごとにこの部分だけ再実行し、RCA・トポロジー描画を含む全体の rerun を避ける）"""
+    with st.expander("💬 Chat with AI Agent", expanded=False):
+        if st.session_state.chat_session is None and api_key and selected_scenario != "正常稼働":
+            genai = _genai()
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel("gemma-3-12b-it")
+            st.session_state.chat_session = model.start_chat(history=[])
+        
+        # 常時描画するのは直近 CHAT_WINDOW 件のみ（古い履歴はトグルで開いたときだけ描画）
+        messages = st.session_state.messages
+        older_messages, recent_messages = messages[:-CHAT_WINDOW], messages[-CHAT_WINDOW:]
+        if older_messages and st.toggle(f"以前のメッセージを表示 ({len(older_messages)}件)", key="show_older_messages"):
+            for msg in older_messages:
+                with st.chat_message(msg["role"]): st.markdown(msg["content"])
+        for msg in recent_messages:
+            with st.chat_message(msg["role"]): st.markdown(msg["content"])
+
+        if prompt := st.chat_input("Ask details..."):
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"): st.markdown(prompt)
+            if st.session_state.chat_session:
+                with st.chat_message("assistant"):
+                    with st.spinner("Thinking..."):
+                        response = generate_content_with_retry(st.session_state.chat_session.model, prompt, stream=True)
+                    if response:
+                        # 受信したチャンクを逐次描画（全文の再連結・再描画を毎チャンク行わない）
+                        full_response = st.write_stream(_stream_text(response))
+                        st.session_state.messages.append({"role": "assistant", "content": full_response})
 
 # --- UI構築 ---
 
+# rerun ごとに何度も参照するため、セッション状態のプロキシはローカル名に束縛しておく
+ss = st.session_state
+
 api_key = None
 if "GOOGLE_API_KEY" in st.secrets:
     api_key = st.secrets["GOOGLE_API_KEY"]
 else:
     api_key = os.environ.get("GOOGLE_API_KEY")
 
+# テナント一覧は rerun ごとに1回だけ取得し、サイドバー・全社ボード・既定スコープで共有
+try:
+    TENANTS = list_tenants() or ['A', 'B']
+except Exception:
+    TENANTS = ['A', 'B']
+
 # --- サイドバー ---
 with st.sidebar:
     st.header("⚡ Scenario Controller")
-    SCENARIO_MAP = {
-        "基本・広域障害": ["正常稼働", "1. WAN全回線断", "2. FW片系障害", "3. L2SWサイレント障害"],
-        "WAN Router": ["4. [WAN] 電源障害：片系", "5. [WAN] 電源障害：両系", "6. [WAN] BGPルートフラッピング", "7. [WAN] FAN故障", "8. [WAN] メモリリーク"],
-        "Firewall (Juniper)": ["9. [FW] 電源障害：片系", "10. [FW] 電源障害：両系", "11. [FW] FAN故障", "12. [FW] メモリリーク"],
-        "L2 Switch": ["13. [L2SW] 電源障害：片系", "14. [L2SW] 電源障害：両系", "15. [L2SW] FAN故障", "16. [L2SW] メモリリーク"],
-        "複合・その他": ["17. [WAN] 複合障害：電源＆FAN", "18. [Complex] 同時多発：FW & AP", "99. [Live] Cisco実機診断"]
-    }
     selected_category = st.selectbox("対象カテゴリ:", list(SCENARIO_MAP.keys()))
     selected_scenario = st.radio("発生シナリオ:", SCENARIO_MAP[selected_category])
 
-    if 'maint_flags' not in st.session_state: st.session_state.maint_flags = {}
+    maint_flags = ss.setdefault('maint_flags', {})
     with st.expander('🛠️ Maintenance', expanded=False):
-        ts = list_tenants() if list_tenants() else ['A','B']
-        selected = st.multiselect('Maintenance 中の会社', options=ts, default=[t for t in ts if st.session_state.maint_flags.get(t, False)], format_func=display_company)
-        st.session_state.maint_flags = {t: (t in selected) for t in ts}
+        ts = TENANTS
+        selected = st.multiselect('Maintenance 中の会社', options=ts, default=[t for t in ts if maint_flags.get(t, False)], format_func=display_company)
+        new_flags = {t: (t in selected) for t in ts}
+        if new_flags != maint_flags:
+            ss.maint_flags = new_flags
 
     st.markdown("---")
     if api_key: st.success("API Connected")
@@ -898,8 +1321,8 @@ with st.sidebar:
         if user_key: api_key = user_key
 
 # --- セッション管理 ---
-if "current_scenario" not in st.session_state: st.session_state.current_scenario = "正常稼働"
-if "selected_scope" not in st.session_state: st.session_state.selected_scope = None
+if "current_scenario" not in ss: ss.current_scenario = "正常稼働"
+if "selected_scope" not in ss: ss.selected_scope = None
 
 # ======================================================================================
 # 上段の全社状態ボード
@@ -911,50 +1334,41 @@ st.markdown("---")
 # ======================================================================================
 # 下段：AIOps インシデント・コックピット（既存のまま）
 # ======================================================================================
-_scope = st.session_state.get("selected_scope")
-if _scope and isinstance(_scope, dict) and _scope.get("tenant") and _scope.get("network"):
-    ACTIVE_TENANT = _scope["tenant"]
-    ACTIVE_NETWORK = _scope["network"]
-else:
+_scope = ss.get("selected_scope") or {}
+ACTIVE_TENANT, ACTIVE_NETWORK = _scope.get("tenant"), _scope.get("network")
+if not (ACTIVE_TENANT and ACTIVE_NETWORK):
     try:
-        _ts = list_tenants(); _t0 = _ts[0] if _ts else "A"
+        _t0 = TENANTS[0] if TENANTS else "A"
         _ns = list_networks(_t0); _n0 = _ns[0] if _ns else "default"
     except:
         _t0, _n0 = "A", "default"
     ACTIVE_TENANT, ACTIVE_NETWORK = _t0, _n0
-    st.session_state.selected_scope = {"tenant": _t0, "network": _n0}
+    ss.selected_scope = {"tenant": _t0, "network": _n0}
 
 _paths = get_paths(ACTIVE_TENANT, ACTIVE_NETWORK)
-TOPOLOGY = load_topology(_paths.topology_path)
-
-for key in ["live_result", "messages", "chat_session", "trigger_analysis", "verification_result", "generated_report", "verification_log", "last_report_cand_id", "logic_engine"]:
-    if key not in st.session_state:
-        st.session_state[key] = None if key != "messages" and key != "trigger_analysis" else ([] if key == "messages" else False)
+topo_mtime = topology_mtime(_paths.topology_path)
+TOPOLOGY = load_topology_cached(_paths.topology_path, topo_mtime)
+
+for key in ["live_result", "messages", "chat_session", "trigger_analysis", "verification_result", "generated_report", "verification_log", "last_report_cand_id"]:
+    if key not in ss:
+        ss[key] = None if key != "messages" and key != "trigger_analysis" else ([] if key == "messages" else False)
+
+# シナリオ切替時に初期化するキー（messages は共有を避けるため更新時に新しいリストを渡す）
+_SCENARIO_RESET = {
+    "chat_session": None, "live_result": None, "trigger_analysis": False,
+    "verification_result": None, "generated_report": None,
+    "verification_log": None, "last_report_cand_id": None,
+}
 
-try:
-    topo_mtime = os.path.getmtime(_paths.topology_path)
-except: topo_mtime = 0.0
-engine_sig = f"{ACTIVE_TENANT}/{ACTIVE_NETWORK}:{topo_mtime}"
-
-if st.session_state.get("logic_engine_sig") != engine_sig:
-    st.session_state.logic_engine = LogicalRCA(TOPOLOGY)
-    st.session_state.logic_engine_sig = engine_sig
-
-if st.session_state.current_scenario != selected_scenario:
-    st.session_state.current_scenario = selected_scenario
-    st.session_state.messages = []; st.session_state.chat_session = None; st.session_state.live_result = None
-    st.session_state.trigger_analysis = False; st.session_state.verification_result = None
-    st.session_state.generated_report = None; st.session_state.verification_log = None
-    if "remediation_plan" in st.session_state: del st.session_state.remediation_plan
+if ss.current_scenario != selected_scenario:
+    ss.update(_SCENARIO_RESET, current_scenario=selected_scenario, messages=[])
+    ss.pop("remediation_plan", None)
     st.rerun()
 
-alarms = _make_alarms(TOPOLOGY, selected_scenario)
-target_device_id = None
-root_severity = "CRITICAL"
+# アラームはスコープ×トポロジー mtime 単位でキャッシュ済み（rerun ごとの生成は行わない）
+alarms = _alarms_for(ACTIVE_TENANT, ACTIVE_NETWORK, selected_scenario, topo_mtime)
 
-engine = st.session_state.logic_engine
-engine.SILENT_RATIO = 0.3 if "サイレント" in selected_scenario else 0.5
-analysis_results = engine.analyze(alarms)
+analysis_results = _analyze_scope(ACTIVE_TENANT, ACTIVE_NETWORK, selected_scenario, topo_mtime)
 
 scenario_impact = _get_scenario_impact_level(selected_scenario)
 if analysis_results and scenario_impact > 0:
@@ -989,26 +1403,37 @@ for cand in analysis_results:
 if root_cause_candidates and downstream_devices:
     st.info(f"📍 **根本原因**: {root_cause_candidates[0]['id']} → 影響範囲: 配下 {len(downstream_devices)} 機器")
 
-df_data = []
-for rank, cand in enumerate(root_cause_candidates, 1):
-    status = "⚪ 監視中"; action = "👁️ 静観"
-    is_silent = ("Silent" in str(cand.get("type","")) or "サイレント" in str(cand.get("type","")))
-    if is_silent:
-        status = "🟣 サイレント疑い (上位設備)"; action = "🔍 上位SW/配下影響を確認"
-    else:
-        if cand['prob'] > 0.8: status = "🔴 危険 (根本原因)"; action = "🚀 自動修復が可能"
-        elif cand['prob'] > 0.6: status = "🟡 警告 (被疑箇所)"; action = "🔍 詳細調査を推奨"
-    if "Network/Unreachable" in cand['type']: status = "⚫ 応答なし (上位障害)"; action = "⛔ 対応不要"
-
-    candidate_text = f"デバイス: {cand['id']} / 原因: {cand['label']}"
-    if cand.get('verification_log'): candidate_text += " [🔍 Active Probe: 応答なし]"
-    df_data.append({
-        "順位": rank, "ステータス": status, "根本原因候補": candidate_text,
-        "影響度": _get_impact_display(cand, scope_status), "状態": _get_impact_label(cand, scope_status),
-        "推奨アクション": action, "ID": cand['id'], "Type": cand['type']
-    })
-
-df = pd.DataFrame(df_data)
+# 候補テーブルは列単位で構築（行ごとの dict 生成・分岐を省略）
+cand_types = [str(c.get("type", "")) for c in root_cause_candidates]
+cand_probs = np.array([c['prob'] for c in root_cause_candidates], dtype=float)
+is_silent = np.array([("Silent" in t or "サイレント" in t) for t in cand_types], dtype=bool)
+is_unreachable = np.array(["Network/Unreachable" in t for t in cand_types], dtype=bool)
+# 優先順: 応答なし > サイレント疑い > 危険 > 警告 > 監視中
+status_conditions = [is_unreachable, is_silent, cand_probs > 0.8, cand_probs > 0.6]
+cand_status = np.select(
+    status_conditions,
+    ["⚫ 応答なし (上位障害)", "🟣 サイレント疑い (上位設備)", "🔴 危険 (根本原因)", "🟡 警告 (被疑箇所)"],
+    default="⚪ 監視中",
+)
+cand_action = np.select(
+    status_conditions,
+    ["⛔ 対応不要", "🔍 上位SW/配下影響を確認", "🚀 自動修復が可能", "🔍 詳細調査を推奨"],
+    default="👁️ 静観",
+)
+
+df = pd.DataFrame({
+    "順位": np.arange(1, len(root_cause_candidates) + 1),
+    "ステータス": pd.Categorical(cand_status),
+    "根本原因候補": [
+        f"デバイス: {c['id']} / 原因: {c['label']}" + (" [🔍 Active Probe: 応答なし]" if c.get('verification_log') else "")
+        for c in root_cause_candidates
+    ],
+    "影響度": [_get_impact_display(c, scope_status) for c in root_cause_candidates],
+    "状態": [_get_impact_label(c, scope_status) for c in root_cause_candidates],
+    "推奨アクション": pd.Categorical(cand_action),
+    "ID": [c['id'] for c in root_cause_candidates],
+    "Type": [c['type'] for c in root_cause_candidates],
+})
 st.info("💡 ヒント: インシデントの行をクリックすると、右側に詳細分析と復旧プランが表示されます。")
 
 event = st.dataframe(
@@ -1023,8 +1448,19 @@ event = st.dataframe(
 
 if downstream_devices:
     with st.expander(f"▼ 影響を受けている機器 ({len(downstream_devices)}台) - 上流復旧待ち", expanded=False):
-        dd_df = pd.DataFrame([{"No": i+1, "デバイス": d['id'], "状態": "⚫ 応答なし", "備考": "上流復旧待ち"} for i, d in enumerate(downstream_devices)])
-        st.dataframe(dd_df, use_container_width=True, hide_index=True)
+        if len(downstream_devices) <= SMALL_TABLE_ROWS:
+            # 少数行の静的表示は Markdown 表で十分（DataFrame 構築・Arrow 変換を省略）
+            dd_lines = ["| No | デバイス | 状態 | 備考 |", "|---:|---|---|---|"]
+            dd_lines += [f"| {i} | {d['id']} | ⚫ 応答なし | 上流復旧待ち |" for i, d in enumerate(downstream_devices, 1)]
+            st.markdown("\n".join(dd_lines))
+        else:
+            dd_df = pd.DataFrame({
+                "No": range(1, len(downstream_devices) + 1),
+                "デバイス": [d['id'] for d in downstream_devices],
+                "状態": "⚫ 応答なし",
+                "備考": "上流復旧待ち",
+            })
+            st.dataframe(dd_df, use_container_width=True, hide_index=True)
 
 if event.selection and len(event.selection.rows) > 0:
     sel_row = df.iloc[event.selection.rows[0]]
@@ -1049,23 +1485,23 @@ with col_map:
             with st.status("Agent Operating...", expanded=True) as status:
                 target_node_obj = TOPOLOGY.get(selected_incident_candidate['id']) if selected_incident_candidate else None
                 res = run_diagnostic_simulation(selected_scenario, target_node_obj, api_key)
-                st.session_state.live_result = res
+                ss.live_result = res
                 if res["status"] == "SUCCESS":
                     st.write("✅ Log Acquired & Sanitized.")
                     status.update(label="Diagnostics Complete!", state="complete", expanded=False)
-                    st.session_state.verification_result = verify_log_content(res.get('sanitized_log', ""))
-                    st.session_state.trigger_analysis = True
+                    ss.verification_result = verify_log_content(res.get('sanitized_log', ""))
+                    ss.trigger_analysis = True
                 else:
                     status.update(label="Diagnostics Failed", state="error")
             st.rerun()
 
-    if st.session_state.live_result:
-        res = st.session_state.live_result
+    if ss.live_result:
+        res = ss.live_result
         if res["status"] == "SUCCESS":
             st.markdown("#### 📄 Diagnostic Results")
             with st.container(border=True):
-                if st.session_state.verification_result:
-                    v = st.session_state.verification_result
+                if ss.verification_result:
+                    v = ss.verification_result
                     c1, c2, c3 = st.columns(3)
                     c1.metric("Ping", v.get('ping_status')); c2.metric("IF", v.get('interface_status')); c3.metric("HW", v.get('hardware_status'))
                 st.divider()
@@ -1076,11 +1512,11 @@ with col_chat:
     
     if selected_incident_candidate:
         cand = selected_incident_candidate
-        if "generated_report" not in st.session_state or st.session_state.generated_report is None:
+        if "generated_report" not in ss or ss.generated_report is None:
             if api_key and selected_scenario != "正常稼働":
                 if st.button("📝 詳細レポートを作成 (Generate Report)"):
-                    report_container = st.empty()
                     cfg = load_config_sanitized(cand['id'])
+                    genai = _genai()
                     genai.configure(api_key=api_key)
                     model = genai.GenerativeModel("gemma-3-12b-it")
                     
@@ -1098,78 +1534,20 @@ with col_chat:
                     """
                     try:
                         response = generate_content_with_retry(model, prompt, stream=True)
-                        full_text = ""
-                        for chunk in response:
-                            full_text += chunk.text
-                            report_container.markdown(full_text)
-                        st.session_state.generated_report = full_text
+                        ss.generated_report = st.write_stream(_stream_text(response))
                     except Exception as e:
                         st.error(f"Report Generation Error: {str(e)}")
         else:
-            st.markdown(st.session_state.generated_report)
+            st.markdown(ss.generated_report)
             if st.button("🔄 レポート再作成"):
-                st.session_state.generated_report = None; st.rerun()
+                ss.generated_report = None; st.rerun()
 
     st.markdown("---")
     st.subheader("🤖 Remediation & Chat")
     
-    # 自動修復フラグチェック
-    if st.session_state.get("auto_remediate"):
-        st.session_state.auto_remediate = False
-        if selected_incident_candidate and selected_incident_candidate["prob"] > 0.6:
-            st.session_state.remediation_plan = "Auto-generating..."
-    
-    if selected_incident_candidate and selected_incident_candidate["prob"] > 0.6:
-        if "remediation_plan" not in st.session_state:
-            if st.button("✨ 修復プランを作成 (Generate Fix)"):
-                 if not api_key: st.error("API Key Required")
-                 else:
-                    with st.spinner("Generating plan..."):
-                        t_node = TOPOLOGY.get(selected_incident_candidate["id"])
-                        plan_md = generate_remediation_commands(selected_scenario, f"Root Cause: {selected_incident_candidate['label']}", t_node, api_key)
-                        st.session_state.remediation_plan = plan_md
-                        st.rerun()
-        
-        if "remediation_plan" in st.session_state:
-            if st.session_state.remediation_plan == "Auto-generating...":
-                with st.spinner("自動修復プランを生成中..."):
-                    t_node = TOPOLOGY.get(selected_incident_candidate["id"])
-                    plan_md = generate_remediation_commands(selected_scenario, f"Root Cause: {selected_incident_candidate['label']}", t_node, api_key)
-                    st.session_state.remediation_plan = plan_md
-                    st.rerun()
-            else:
-                with st.container(border=True):
-                    st.info("AI Generated Recovery Procedure")
-                    st.markdown(st.session_state.remediation_plan)
-                c1, c2 = st.columns(2)
-                with c1:
-                    if st.button("🚀 修復実行 (Execute)", type="primary"):
-                        st.success("Remediation Executed.")
-                with c2:
-                    if st.button("キャンセル"):
-                        del st.session_state.remediation_plan; st.rerun()
-
-    with st.expander("💬 Chat with AI Agent", expanded=False):
-        if st.session_state.chat_session is None and api_key and selected_scenario != "正常稼働":
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemma-3-12b-it")
-            st.session_state.chat_session = model.start_chat(history=[])
-        
-        for msg in st.session_state.messages:
-            with st.chat_message(msg["role"]): st.markdown(msg["content"])
-
-        if prompt := st.chat_input("Ask details..."):
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            with st.chat_message("user"): st.markdown(prompt)
-            if st.session_state.chat_session:
-                with st.chat_message("assistant"):
-                    with st.spinner("Thinking..."):
-                        res_container = st.empty(); full_response = ""
-                        response = generate_content_with_retry(st.session_state.chat_session.model, prompt, stream=True)
-                        if response:
-                            for chunk in response: full_response += chunk.text; res_container.markdown(full_response)
-                            st.session_state.messages.append({"role": "assistant", "content": full_response})
+    _remediation_panel(selected_incident_candidate, selected_scenario, api_key, TOPOLOGY)
+    _chat_panel(selected_scenario, api_key)
 
-if st.session_state.trigger_analysis and st.session_state.live_result:
-    st.session_state.trigger_analysis = False
+if ss.trigger_analysis and ss.live_result:
+    ss.trigger_analysis = False
     st.rerun()
@@ -5,8 +5,11 @@ Google Antigravity AIOps Agent - Data Module (Optimized Final)
 
 import json
 import os
+import sys
 import logging
-from typing import Dict, Optional, Any
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 
 # =====================================================
@@ -26,9 +29,12 @@ class TopologyConstants:
 # =====================================================
 # データクラス定義
 # =====================================================
-@dataclass
+@dataclass(slots=True)
 class NetworkNode:
-    """ネットワークノードを表現するデータクラス"""
+    """
+    ネットワークノードを表現するデータクラス
+    ※ __slots__ 化（インスタンス辞書を持たず、多数のトポロジー読み込み時のメモリと属性参照を削減）
+    """
     id: str
     layer: int
     type: str
@@ -120,7 +126,8 @@ def load_topology_from_json(filename: str = TopologyConstants.DEFAULT_TOPOLOGY_F
             node = NetworkNode(
                 id=key,
                 layer=value.get("layer", TopologyConstants.DEFAULT_LAYER),
-                type=value.get("type", TopologyConstants.DEFAULT_TYPE),
+                # タイプ文字列は種類が少ないため intern して全ノードで共有（比較・辞書参照を高速化）
+                type=sys.intern(str(value.get("type", TopologyConstants.DEFAULT_TYPE))),
                 parent_id=value.get("parent_id"),
                 redundancy_group=value.get("redundancy_group"),
                 metadata=value.get("metadata", {})
@@ -176,6 +183,119 @@ def _has_circular_reference(node: NetworkNode, topology: Dict[str, NetworkNode],
         return _has_circular_reference(parent, topology, visited)
     return False
 
+# =====================================================
+# トポロジーインデックス
+# =====================================================
+@dataclass(frozen=True)
+class TopologyIndex:
+    """タイプ/レイヤー/親子関係/冗長グループの二次インデックス（トポロジー順を保持）"""
+    by_type: Dict[str, List[str]]
+    by_type_layer: Dict[Tuple[str, int], List[str]]
+    by_layer: Dict[int, List[str]]
+    children_of: Dict[str, List[str]]
+    by_redundancy_group: Dict[str, List[str]]
+    node_ids: Tuple[str, ...] = ()
+    # find() の結果メモ {(node_type, layer, keyword): node_id}
+    _find_cache: Dict[Tuple[Optional[str], Optional[int], Optional[str]], Optional[str]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+    def first(self, node_type: str, layer: Optional[int] = None) -> Optional[str]:
+        """条件に一致する最初のノードIDを返す"""
+        if layer is None:
+            ids = self.by_type.get(node_type)
+        else:
+            ids = self.by_type_layer.get((node_type, layer))
+        return ids[0] if ids else None
+
+    def find(self, node_type: Optional[str] = None, layer: Optional[int] = None,
+             keyword: Optional[str] = None) -> Optional[str]:
+        """
+        タイプ/レイヤー/ID部分一致の条件で最初のノードIDを返す
+        ※ 同一トポロジーに対する同じ条件の検索は結果をメモ化（キーワード検索の走査も1回のみ）
+        """
+        key = (node_type, layer, keyword)
+        try:
+            return self._find_cache[key]
+        except KeyError:
+            pass
+
+        if node_type:
+            ids = self.by_type.get(node_type, []) if layer is None else self.by_type_layer.get((node_type, layer), [])
+        elif layer is not None:
+            ids = self.by_layer.get(layer, [])
+        else:
+            ids = self.node_ids
+        if keyword:
+            ids = (nid for nid in ids if keyword in str(nid))
+        result = next(iter(ids), None)
+        self._find_cache[key] = result
+        return result
+
+
+def build_topology_index(topology: Dict[str, Any]) -> TopologyIndex:
+    """トポロジーを1回走査してインデックスを構築"""
+    by_type: Dict[str, List[str]] = {}
+    by_type_layer: Dict[Tuple[str, int], List[str]] = {}
+    by_layer: Dict[int, List[str]] = {}
+    children_of: Dict[str, List[str]] = {}
+    by_redundancy_group: Dict[str, List[str]] = {}
+
+    for node_id, node in topology.items():
+        node_type = getattr(node, "type", None)
+        layer = getattr(node, "layer", None)
+        if layer is not None:
+            by_layer.setdefault(layer, []).append(node_id)
+        if node_type is not None:
+            node_type = str(node_type)
+            by_type.setdefault(node_type, []).append(node_id)
+            if layer is not None:
+                by_type_layer.setdefault((node_type, layer), []).append(node_id)
+
+        parent_id = getattr(node, "parent_id", None)
+        if parent_id:
+            children_of.setdefault(parent_id, []).append(node_id)
+
+        group = getattr(node, "redundancy_group", None)
+        if group:
+            by_redundancy_group.setdefault(group, []).append(node_id)
+
+    return TopologyIndex(
+        by_type=by_type,
+        by_type_layer=by_type_layer,
+        by_layer=by_layer,
+        children_of=children_of,
+        by_redundancy_group=by_redundancy_group,
+        node_ids=tuple(topology),
+    )
+
+
+_INDEX_CACHE_SIZE = 32
+_index_cache: "OrderedDict[int, Tuple[Dict[str, Any], TopologyIndex]]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_topology_index(topology: Dict[str, Any]) -> TopologyIndex:
+    """
+    トポロジーのインデックスを取得（同一オブジェクトに対してはキャッシュを再利用）
+    ※ 読み込み後のトポロジーは変更しない前提
+    """
+    key = id(topology)
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None and cached[0] is topology:
+            _index_cache.move_to_end(key)
+            return cached[1]
+
+    index = build_topology_index(topology)
+
+    with _index_lock:
+        _index_cache[key] = (topology, index)
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
 # =====================================================
 # グローバル変数
 # =====================================================
@@ -4,7 +4,6 @@ import re
 from enum import Enum
 from typing import List, Dict, Any, Optional
 
-import google.generativeai as genai
 
 # ==========================================================
 # AIOps health status
@@ -43,6 +42,8 @@ class LogicalRCA:
         self.model = None
         self._api_configured = False
 
+        # device -> parent（dict 形式 / NetworkNode 形式の差異はここで1回だけ吸収する）
+        self.parent_of: Dict[str, Optional[str]] = {}
         # parent -> [children...]
         self.children_map: Dict[str, List[str]] = {}
         for dev_id, info in self.topology.items():
@@ -56,6 +57,7 @@ class LogicalRCA:
                 elif hasattr(info, "paren"):
                     # data.py の __repr__ が paren... で出るが属性名は parent_id のはず。念のため。
                     p = getattr(info, "paren", None)
+            self.parent_of[dev_id] = p
             if p:
                 self.children_map.setdefault(p, []).append(dev_id)
 
@@ -66,12 +68,7 @@ class LogicalRCA:
         return self.topology.get(device_id, {})
 
     def _get_parent_id(self, device_id: str) -> Optional[str]:
-        info = self._get_device_info(device_id)
-        if isinstance(info, dict):
-            return info.get("parent_id")
-        if hasattr(info, "parent_id"):
-            return getattr(info, "parent_id")
-        return None
+        return self.parent_of.get(device_id)
 
     def _get_metadata(self, device_id: str) -> Dict[str, Any]:
         info = self._get_device_info(device_id)
@@ -117,6 +114,7 @@ class LogicalRCA:
         if not api_key:
             return False
         try:
+            import google.generativeai as genai  # LLM 利用時のみ必要なため遅延 import
             genai.configure(api_key=api_key)
             self.model = genai.GenerativeModel("gemma-3-12b-it")
             self._api_configured = True
@@ -147,11 +145,17 @@ class LogicalRCA:
     # ----------------------------
     # Sanitization
     # ----------------------------
+    # (パターン, 置換) はクラス共有でコンパイル済み（全スコープのエンジンで再利用）
+    _SANITIZE_RULES = [
+        (re.compile(r'(encrypted-password\s+)"[^"]+"'), r'\1"********"'),
+        (re.compile(r"(password|secret)\s+(\d)\s+\S+"), r"\1 \2 ********"),
+        (re.compile(r"(username\s+\S+\s+secret)\s+\d\s+\S+"), r"\1 5 ********"),
+        (re.compile(r"(snmp-server community)\s+\S+"), r"\1 ********"),
+    ]
+
     def _sanitize_text(self, text: str) -> str:
-        text = re.sub(r'(encrypted-password\s+)"[^"]+"', r'\1"********"', text)
-        text = re.sub(r"(password|secret)\s+(\d)\s+\S+", r"\1 \2 ********", text)
-        text = re.sub(r"(username\s+\S+\s+secret)\s+\d\s+\S+", r"\1 5 ********", text)
-        text = re.sub(r"(snmp-server community)\s+\S+", r"\1 ********", text)
+        for pattern, repl in self._SANITIZE_RULES:
+            text = pattern.sub(repl, text)
         return text
 
     # ==========================================================
@@ -166,10 +170,12 @@ class LogicalRCA:
             or "unreachable" in msg_l
         )
 
-    def _detect_silent_failures(self, msg_map: Dict[str, List[str]]) -> Dict[str, Dict[str, Any]]:
+    def _detect_silent_failures(self, msg_map: Dict[str, List[str]], silent_ratio: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
         """
         親自身にアラームが無いのに、配下の複数子が Connection Lost を出しているなら親を疑う。
         """
+        if silent_ratio is None:
+            silent_ratio = self.SILENT_RATIO
         suspects: Dict[str, Dict[str, Any]] = {}
 
         for parent_id, children in self.children_map.items():
@@ -190,7 +196,7 @@ class LogicalRCA:
             total = len(children)
             ratio = len(affected) / max(total, 1)
 
-            if len(affected) >= self.SILENT_MIN_CHILDREN and ratio >= self.SILENT_RATIO:
+            if len(affected) >= self.SILENT_MIN_CHILDREN and ratio >= silent_ratio:
                 report = (
                     f"[Silent Failure Heuristic]\n"
                     f"- Suspected upstream device: {parent_id}\n"
@@ -215,23 +221,39 @@ class LogicalRCA:
     # ==========================================================
     # Public API
     # ==========================================================
-    def analyze(self, alarms: List) -> List[Dict[str, Any]]:
+    @staticmethod
+    def no_alarm_result() -> List[Dict[str, Any]]:
+        """アラームが無い場合の解析結果（エンジン構築なしで参照可能）"""
+        return [{
+            "id": "SYSTEM",
+            "label": "No alerts detected",
+            "prob": 0.0,
+            "type": "Normal",
+            "tier": 0,
+            "reason": "No active alerts detected."
+        }]
+
+    def analyze(self, alarms: List, silent_ratio: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        :param silent_ratio: サイレント障害推定の閾値（未指定時は SILENT_RATIO）。
+            エンジンは複数セッションで共有されるため、呼び出しごとの閾値はここで渡す。
+        """
         if not alarms:
-            return [{
-                "id": "SYSTEM",
-                "label": "No alerts detected",
-                "prob": 0.0,
-                "type": "Normal",
-                "tier": 0,
-                "reason": "No active alerts detected."
-            }]
+            return self.no_alarm_result()
+        return self.complete_analysis(self.analyze_rules(alarms, silent_ratio))
 
+    def analyze_rules(self, alarms: List, silent_ratio: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        LLM を呼ばずに確定できる部分のみ判定（入力が同じなら結果も同じ）
+        ※ LLM 判定が必要なデバイスは {"id", "pending_alerts"} の未確定エントリとして返す。
+          並びは未ソートのため、complete_analysis() で確定・整列してから使うこと。
+        """
         msg_map: Dict[str, List[str]] = {}
         for a in alarms:
             msg_map.setdefault(a.device_id, []).append(a.message)
 
         # サイレント推定
-        silent_suspects = self._detect_silent_failures(msg_map)
+        silent_suspects = self._detect_silent_failures(msg_map, silent_ratio)
 
         # 親を分析対象に追加（疑似アラーム）
         for parent_id, info in silent_suspects.items():
@@ -297,34 +319,51 @@ class LogicalRCA:
                 })
                 continue
 
-            analysis = self.analyze_redundancy_depth(device_id, messages)
+            analysis = self._rule_based_assessment(device_id, messages)
+            if analysis is None:
+                # LLM 判定待ち（結果は呼び出しごとに変わり得るため、ここでは確定しない）
+                results.append({"id": device_id, "pending_alerts": list(messages)})
+                continue
 
-            if analysis.get("impact_type") == "UNKNOWN" and "API key not configured" in analysis.get("reason", ""):
-                prob = 0.5
-                tier = 3
-            else:
-                if analysis["status"] == HealthStatus.CRITICAL:
-                    prob = 0.9
-                    tier = 1
-                elif analysis["status"] == HealthStatus.WARNING:
-                    prob = 0.7
-                    tier = 2
-                else:
-                    prob = 0.3
-                    tier = 3
-
-            results.append({
-                "id": device_id,
-                "label": " / ".join(messages),
-                "prob": prob,
-                "type": analysis.get("impact_type", "UNKNOWN"),
-                "tier": tier,
-                "reason": analysis.get("reason", "AI provided no reason")
-            })
+            results.append(self._candidate_from_assessment(device_id, messages, analysis))
 
+        return results
+
+    def complete_analysis(self, partial_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """analyze_rules() の未確定エントリを LLM で判定し、確度順に並べた最終結果を返す（入力は変更しない）"""
+        results = [
+            self._candidate_from_assessment(r["id"], r["pending_alerts"], self._ai_assessment(r["id"], r["pending_alerts"]))
+            if "pending_alerts" in r else r
+            for r in partial_results
+        ]
         results.sort(key=lambda x: x["prob"], reverse=True)
         return results
 
+    @staticmethod
+    def _candidate_from_assessment(device_id: str, messages: List[str], analysis: Dict[str, Any]) -> Dict[str, Any]:
+        if analysis.get("impact_type") == "UNKNOWN" and "API key not configured" in analysis.get("reason", ""):
+            prob = 0.5
+            tier = 3
+        else:
+            if analysis["status"] == HealthStatus.CRITICAL:
+                prob = 0.9
+                tier = 1
+            elif analysis["status"] == HealthStatus.WARNING:
+                prob = 0.7
+                tier = 2
+            else:
+                prob = 0.3
+                tier = 3
+
+        return {
+            "id": device_id,
+            "label": " / ".join(messages),
+            "prob": prob,
+            "type": analysis.get("impact_type", "UNKNOWN"),
+            "tier": tier,
+            "reason": analysis.get("reason", "AI provided no reason")
+        }
+
     # ==========================================================
     # Core decision function
     # ==========================================================
@@ -340,6 +379,10 @@ class LogicalRCA:
         # 将来、インベントリ＋過去の証跡が十分に利用できるようになったら、
         # この判断はAIに委譲すべきです。
         """
+        return self._rule_based_assessment(device_id, alerts) or self._ai_assessment(device_id, alerts)
+
+    def _rule_based_assessment(self, device_id: str, alerts: List[str]) -> Optional[Dict[str, Any]]:
+        """ローカル安全ルールで判定（該当ルールがなければ None を返し、LLM 判定に委ねる）"""
         if not alerts:
             return {"status": HealthStatus.NORMAL, "reason": "No active alerts detected.", "impact_type": "NONE"}
 
@@ -375,10 +418,15 @@ class LogicalRCA:
                 return {"status": HealthStatus.CRITICAL, "reason": "Memory leak/high with OOM/crash symptom detected (local safety rule).", "impact_type": "Software/Resource"}
             return {"status": HealthStatus.WARNING, "reason": "Memory high/leak symptom detected. Likely degraded but not down yet (local safety rule).", "impact_type": "Software/Resource"}
 
+        return None
+
+    def _ai_assessment(self, device_id: str, alerts: List[str]) -> Dict[str, Any]:
+        """LLM による判定（API 未設定・失敗時はその旨の結果を返す）"""
         # 4) LLM
         if not self._ensure_api_configured():
             return {"status": HealthStatus.WARNING, "reason": "API key not configured. Manual analysis required.", "impact_type": "UNKNOWN"}
 
+        safe_alerts = [self._sanitize_text(a) for a in alerts]
         metadata = self._get_metadata(device_id)
         safe_config = self._sanitize_text(self._read_config(device_id))
 
@@ -5,9 +5,10 @@ Google Antigravity AIOps Agent - Logic Module (Optimized Final)
 """
 
 import logging
+from collections import deque
 from typing import List, Dict, Set, Optional
 from dataclasses import dataclass, field
-from data import TOPOLOGY, NetworkNode
+from data import TOPOLOGY, NetworkNode, get_topology_index
 
 # =====================================================
 # ロギング設定
@@ -18,10 +19,11 @@ logger = logging.getLogger(__name__)
 # データクラス定義
 # =====================================================
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Alarm:
     """
     ネットワークアラームを表現するデータクラス
+    ※ 不変・__slots__ 化（大量生成時のメモリ削減、ハッシュ可能で重複排除に利用可）
     """
     device_id: str
     message: str
@@ -36,7 +38,7 @@ class Alarm:
                 f"Invalid severity '{self.severity}' for alarm {self.device_id}. "
                 f"Valid values: {valid_severities}. Defaulting to 'WARNING'."
             )
-            self.severity = "WARNING"
+            object.__setattr__(self, "severity", "WARNING")
         
         if not self.device_id or not isinstance(self.device_id, str):
             raise ValueError(f"Invalid device_id: {self.device_id}")
@@ -97,8 +99,9 @@ class CausalInferenceEngine:
             )
         
         # アラーム情報の整理
-        alarmed_device_ids = {a.device_id for a in alarms}
         alarm_map = {a.device_id: a for a in alarms}
+        # ID 集合は alarm_map のキービューで兼用（同じ内容の set を別途作らない）
+        alarmed_device_ids = alarm_map.keys()
         
         # 階層順にソート（layer値が小さいほど上位層）
         sorted_alarms = sorted(
@@ -159,10 +162,9 @@ class CausalInferenceEngine:
         alarm_map: Dict[str, Alarm]
     ) -> InferenceResult:
         """冗長性構成（HA）の分析"""
-        group_members = [
-            n for n in self.topology.values() 
-            if n.redundancy_group == node.redundancy_group
-        ]
+        # グループのメンバーはインデックスから取得（全ノード走査を回避）
+        member_ids = get_topology_index(self.topology).by_redundancy_group.get(node.redundancy_group, [])
+        group_members = [self.topology[nid] for nid in member_ids]
         down_members = [n for n in group_members if n.id in alarmed_ids]
         
         # エラー詳細の構築
@@ -206,10 +208,10 @@ class CausalInferenceEngine:
         parent_node = self.topology.get(parent_id)
         if not parent_node: return None
         
-        children = [n for n in self.topology.values() if n.parent_id == parent_id]
+        children = get_topology_index(self.topology).children_of.get(parent_id, [])
         if not children: return None
         
-        children_down = sum(1 for c in children if c.id in alarmed_ids)
+        children_down = sum(1 for child_id in children if child_id in alarmed_ids)
         
         if children_down == len(children):
             return InferenceResult(
@@ -243,23 +245,20 @@ def simulate_cascade_failure(
     root_alarm = Alarm(root_cause_id, custom_message, "CRITICAL")
     generated_alarms.append(root_alarm)
     
-    # BFSで子デバイスを探索
-    queue = [root_cause_id]
+    # BFSで子デバイスを探索（親→子インデックスを利用）
+    children_of = get_topology_index(topology).children_of
+    queue = deque([root_cause_id])
     processed = {root_cause_id}
     
     while queue:
-        current_parent_id = queue.pop(0)
-        children = [
-            n for n in topology.values() 
-            if n.parent_id == current_parent_id
-        ]
+        current_parent_id = queue.popleft()
         
-        for child in children:
-            if child.id not in processed:
-                child_alarm = Alarm(child.id, "Unreachable", "WARNING")
+        for child_id in children_of.get(current_parent_id, []):
+            if child_id not in processed:
+                child_alarm = Alarm(child_id, "Unreachable", "WARNING")
                 generated_alarms.append(child_alarm)
-                queue.append(child.id)
-                processed.add(child.id)
+                queue.append(child_id)
+                processed.add(child_id)
                 
     return generated_alarms
 
@@ -5,8 +5,6 @@ import re
 import os
 import time
 import json
-import google.generativeai as genai
-from netmiko import ConnectHandler
 
 SANDBOX_DEVICE = {
     'device_type': 'cisco_nxos',
@@ -32,13 +30,19 @@ def sanitize_output(text: str) -> str:
         text = re.sub(pattern, replacement, text)
     return text
 
+def _configure_genai(api_key):
+    """google.generativeai は AI 呼び出し時に初めて import（起動時の読み込みを省略）"""
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai
+
 def generate_fake_log_by_ai(scenario_name, target_node, api_key):
     """
     シナリオ名と機器メタデータから、AIが自律的に障害ログを生成する
     """
     if not api_key: return "Error: API Key Missing"
     
-    genai.configure(api_key=api_key)
+    genai = _configure_genai(api_key)
     model = genai.GenerativeModel(
         "gemma-3-12b-it",
         generation_config={"temperature": 0.2}
@@ -82,7 +86,7 @@ def generate_fake_log_by_ai(scenario_name, target_node, api_key):
 
 def generate_config_from_intent(target_node, current_config, intent_text, api_key):
     if not api_key: return "Error: API Key Missing"
-    genai.configure(api_key=api_key)
+    genai = _configure_genai(api_key)
     model = genai.GenerativeModel("gemma-3-12b-it", generation_config={"temperature": 0.0})
     
     vendor = target_node.metadata.get("vendor", "Unknown Vendor")
@@ -103,7 +107,7 @@ def generate_config_from_intent(target_node, current_config, intent_text, api_ke
 
 def generate_health_check_commands(target_node, api_key):
     if not api_key: return "Error: API Key Missing"
-    genai.configure(api_key=api_key)
+    genai = _configure_genai(api_key)
     model = genai.GenerativeModel("gemma-3-12b-it", generation_config={"temperature": 0.0})
     
     vendor = target_node.metadata.get("vendor", "Unknown Vendor")
@@ -121,7 +125,7 @@ def generate_remediation_commands(scenario, analysis_result, target_node, api_ke
     障害シナリオと分析結果に基づき、復旧手順（物理対応＋コマンド＋確認）を生成する
     """
     if not api_key: return "Error: API Key Missing"
-    genai.configure(api_key=api_key)
+    genai = _configure_genai(api_key)
     model = genai.GenerativeModel("gemma-3-12b-it", generation_config={"temperature": 0.0})
     
     prompt = f"""
@@ -164,6 +168,8 @@ def run_diagnostic_simulation(scenario_type, target_node=None, api_key=None):
     if "[Live]" in scenario_type:
         commands = ["terminal length 0", "show version", "show interface brief", "show ip route"]
         try:
+            # netmiko（paramiko 等を含む）は重いため、実機接続時にのみ読み込む
+            from netmiko import ConnectHandler
             with ConnectHandler(**SANDBOX_DEVICE) as ssh:
                 if not ssh.check_enable_mode(): ssh.enable()
                 prompt = ssh.find_prompt()
@@ -192,7 +198,7 @@ def predict_initial_symptoms(scenario_name, api_key):
     """
     if not api_key: return {}
     
-    genai.configure(api_key=api_key)
+    genai = _configure_genai(api_key)
     model = genai.GenerativeModel("gemma-3-12b-it", generation_config={"temperature": 0.0})
     
     prompt = f"""
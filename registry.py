@@ -9,14 +9,15 @@ Canonical layout:
 This module centralizes:
 - tenant/network discovery
 - topology path + config dir resolution
-- topology loading
+- topology loading (mtime-keyed cache)
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 from data import load_topology_from_json, NetworkNode
 
@@ -37,22 +38,41 @@ def _tenants_root() -> Path:
     return _project_root() / "tenants"
 
 
-def list_tenants() -> List[str]:
+def _dir_mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+@lru_cache(maxsize=1)
+def _list_tenants_cached(mtime_ns: Optional[int]) -> Tuple[str, ...]:
     troot = _tenants_root()
-    if not troot.exists():
-        return ["A", "B"]
+    if mtime_ns is None:
+        return ("A", "B")
     tenants = sorted([p.name for p in troot.iterdir() if p.is_dir() and not p.name.startswith(".")])
-    return tenants or ["A", "B"]
+    return tuple(tenants) or ("A", "B")
 
 
-def list_networks(tenant_id: str) -> List[str]:
+@lru_cache(maxsize=256)
+def _list_networks_cached(tenant_id: str, mtime_ns: Optional[int]) -> Tuple[str, ...]:
     nroot = _tenants_root() / tenant_id / "networks"
-    if not nroot.exists():
-        return ["default"]
+    if mtime_ns is None:
+        return ("default",)
     nets = sorted([p.name for p in nroot.iterdir() if p.is_dir() and not p.name.startswith(".")])
-    return nets or ["default"]
+    return tuple(nets) or ("default",)
+
+
+def list_tenants() -> List[str]:
+    # Directory listing is cached per directory mtime (adding/removing a tenant bumps it)
+    return list(_list_tenants_cached(_dir_mtime_ns(_tenants_root())))
+
+
+def list_networks(tenant_id: str) -> List[str]:
+    return list(_list_networks_cached(tenant_id, _dir_mtime_ns(_tenants_root() / tenant_id / "networks")))
 
 
+@lru_cache(maxsize=1024)
 def get_paths(tenant_id: str, network_id: str) -> TenantNetworkPaths:
     topo = _tenants_root() / tenant_id / "networks" / network_id / "topology.json"
     cfg = _tenants_root() / tenant_id / "networks" / network_id / "configs"
@@ -68,3 +88,18 @@ def topology_mtime(path: Path) -> float:
 
 def load_topology(topology_path: Path) -> Dict[str, NetworkNode]:
     return load_topology_from_json(str(topology_path))
+
+
+@lru_cache(maxsize=64)
+def _load_topology_cached(topology_path: str, mtime: float) -> Dict[str, NetworkNode]:
+    return load_topology_from_json(topology_path)
+
+
+def load_topology_cached(topology_path: Path, mtime: Optional[float] = None) -> Dict[str, NetworkNode]:
+    """
+    Load a topology once per (path, mtime) and share the parsed object.
+    The returned dict is shared between callers and must not be mutated.
+    """
+    if mtime is None:
+        mtime = topology_mtime(topology_path)
+    return _load_topology_cached(str(topology_path), mtime)
@@ -118,6 +118,11 @@ class PatternMatcher:
         )
         
         self.cisco_ping_success = re.compile(r'!{3,}')
+        self.cisco_success_rate = re.compile(r'success\s+rate\s+is\s+(\d+)\s*percent', re.I)
+        
+        # 検証対象の判定（ログ全体を lower() でコピーせずに1回の走査で判定）
+        self.ping_keyword = re.compile(r'ping|icmp', re.I)
+        self.hw_keyword = re.compile(r'fan|power|psu|temp', re.I)
         
         # Interface関連
         self.admin_down = re.compile(r'administratively\s+down', re.I)
@@ -128,6 +133,8 @@ class PatternMatcher:
             r'(?:(err-disabled|notconnect))',
             re.I
         )
+        self.if_down_keyword = re.compile(r'down|disabled', re.I)
+        self.if_up_keyword = re.compile(r'up', re.I)
         
         # Hardware関連
         self.hw_check = re.compile(
@@ -135,6 +142,9 @@ class PatternMatcher:
             r'(fail(ed|ure)?|fault(y)?|critical|ok|good|normal|warn(ing)?)',
             re.I | re.DOTALL
         )
+        self.hw_critical_keyword = re.compile(r'fail|fault|critical', re.I)
+        self.hw_ok_keyword = re.compile(r'ok|good|normal', re.I)
+        self.hw_warn_keyword = re.compile(r'warn', re.I)
         
         logger.debug("Patterns compiled successfully")
     
@@ -158,7 +168,7 @@ class PatternMatcher:
         # Cisco形式（!!!!! + success rate）
         cisco_match = self.cisco_ping_success.search(text)
         if cisco_match:
-            success_match = re.search(r'success\s+rate\s+is\s+(\d+)\s*percent', text_lower)
+            success_match = self.cisco_success_rate.search(text)
             if success_match:
                 try:
                     rate = int(success_match.group(1))
@@ -233,11 +243,8 @@ class PatternMatcher:
         if not status_matches:
             return None
         
-        down_count = sum(
-            1 for m in status_matches
-            if 'down' in str(m).lower() or 'disabled' in str(m).lower()
-        )
-        up_count = sum(1 for m in status_matches if 'up' in str(m).lower())
+        down_count = sum(1 for m in status_matches if self.if_down_keyword.search(str(m)))
+        up_count = sum(1 for m in status_matches if self.if_up_keyword.search(str(m)))
         
         if down_count > up_count:
             status = VerificationStatus.CRITICAL
@@ -265,15 +272,9 @@ class PatternMatcher:
         if not hw_matches:
             return None
         
-        critical_count = sum(
-            1 for m in hw_matches
-            if any(k in str(m).lower() for k in ['fail', 'fault', 'critical'])
-        )
-        ok_count = sum(
-            1 for m in hw_matches
-            if any(k in str(m).lower() for k in ['ok', 'good', 'normal'])
-        )
-        warning_count = sum(1 for m in hw_matches if 'warn' in str(m).lower())
+        critical_count = sum(1 for m in hw_matches if self.hw_critical_keyword.search(str(m)))
+        ok_count = sum(1 for m in hw_matches if self.hw_ok_keyword.search(str(m)))
+        warning_count = sum(1 for m in hw_matches if self.hw_warn_keyword.search(str(m)))
         
         if critical_count > 0:
             status = VerificationStatus.CRITICAL
@@ -422,7 +423,7 @@ class LogVerifier:
     
     def _verify_ping(self, text: str, result: VerificationResult):
         """Ping検証"""
-        if 'ping' not in text.lower() and 'icmp' not in text.lower():
+        if not self.matcher.ping_keyword.search(text):
             return
         
         match_result = self.matcher.match_ping(text)
@@ -441,7 +442,7 @@ class LogVerifier:
     
     def _verify_hardware(self, text: str, result: VerificationResult):
         """Hardware検証"""
-        if not any(kw in text.lower() for kw in ['fan', 'power', 'psu', 'temp']):
+        if not self.matcher.hw_keyword.search(text):
             return
         
         match_result = self.matcher.match_hardware(text)